@@ -3,6 +3,7 @@ import requests
 import json
 import base64
 import os
+import time
 
 # API Configuration
 API_URL = "http://127.0.0.1:8000/api"
@@ -48,6 +49,7 @@ with st.sidebar:
     st.markdown("## 🧠 RAG One")
     st.markdown("<div class='glass-card' style='font-size: 0.9em;'>Upload your PDFs or Docs to instantly chat with them using local AI.</div>", unsafe_allow_html=True)
     
+    workspace = st.text_input("Workspace", value="default", help="Separate knowledge base; a new name is created on first upload")
     uploaded_file = st.file_uploader("Upload Knowledge", type=["pdf", "docx", "txt"])
     
     if uploaded_file:
@@ -55,19 +57,60 @@ with st.sidebar:
             with st.spinner("Processing..."):
                 files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
                 try:
-                    res = requests.post(f"{API_URL}/upload", files=files)
-                    if res.status_code == 200:
-                        st.success("Indexing Complete!")
+                    res = requests.post(f"{API_URL}/upload", files=files, params={"workspace": workspace})
+                    if res.status_code in (200, 202):
+                        # Ingestion runs in the background, poll the job until it settles
+                        job_id = res.json()["job_id"]
+                        if res.json().get("duplicate_of"):
+                            st.info(f"Same content as: {', '.join(res.json()['duplicate_of'])}")
+                        progress = st.progress(0.0, text="Extracting text...")
+                        while True:
+                            job = requests.get(f"{API_URL}/jobs/{job_id}").json()
+                            if job["status"] in ("completed", "unchanged", "failed", "cancelled"):
+                                break
+                            if job["pages_total"]:
+                                progress.progress(
+                                    min(job["pages_parsed"] / job["pages_total"], 1.0),
+                                    text=f"Page {job['pages_parsed']}/{job['pages_total']} • {job['chunks_embedded']} chunks embedded"
+                                )
+                            time.sleep(0.5)
+                        progress.empty()
+                        if job["status"] == "completed":
+                            st.success("Indexing Complete!")
+                        elif job["status"] == "unchanged":
+                            st.info("Already indexed, nothing changed.")
+                        else:
+                            st.error(f"Error: {job.get('error') or job['status']}")
+                    elif res.status_code in (400, 413):
+                        st.error(res.json()["detail"])
                     else:
                         st.error(f"Error: {res.text}")
                 except Exception as e:
                     st.error(f"Connection failed: {e}")
 
+    st.markdown("---")
+    st.markdown("### 📚 Documents")
+    try:
+        res = requests.get(f"{API_URL}/documents", params={"workspace": workspace})
+        documents = res.json() if res.ok else []
+    except Exception:
+        documents = []
+    doc_names = {d["doc_id"]: f"{d['filename']} ({d['chunk_count']} chunks)" for d in documents}
+    scope = st.multiselect("Search only in", options=list(doc_names), format_func=doc_names.get)
+    if documents:
+        to_remove = st.selectbox("Document", options=list(doc_names), format_func=doc_names.get, label_visibility="collapsed")
+        if st.button("➖ Remove Document", use_container_width=True):
+            try:
+                requests.delete(f"{API_URL}/documents/{to_remove}", params={"workspace": workspace})
+                st.rerun()
+            except Exception as e:
+                st.error(f"Failed: {e}")
+
     st.markdown("---")
     st.markdown("### ⚙️ Systems")
     if st.button("🗑️ Reset Memory", use_container_width=True):
         try:
-            requests.delete(f"{API_URL}/reset")
+            requests.delete(f"{API_URL}/reset", params={"workspace": workspace})
             st.success("Core memory wiped.")
             st.rerun()
         except Exception as e:
@@ -172,11 +215,13 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
             req_body = {
                 "query": last_msg,
                 "model": model,
-                "messages": clean_history
+                "messages": clean_history,
+                "doc_ids": scope or None,
+                "workspace": workspace
             }
             
             # Placeholder for citations using a mutable container
-            stream_state = {"citations": []}
+            stream_state = {"citations": [], "queue": None}
 
             def stream_generator():
                 with requests.post(f"{API_URL}/query", json=req_body, stream=True) as r:
@@ -189,7 +234,11 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                                     stream_state["citations"] = data["citations"]
                                 elif "chunk" in data:
                                     yield data["chunk"]
+                                elif "queue_position" in data and stream_state["queue"] is not None:
+                                    stream_state["queue"].caption(data["status"])
                                 elif "status" in data:
+                                    if stream_state["queue"] is not None:
+                                        stream_state["queue"].empty()
                                     # Show status toast or log
                                     print(f"Status: {data['status']}")
                                     # Optional: st.toast(data['status']) - but tricky inside generator
@@ -198,6 +247,7 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
 
             # Stream the response
             with st.chat_message("assistant"):
+                stream_state["queue"] = st.empty()
                 response_text = st.write_stream(stream_generator())
                 
                 # Show citations after stream
@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Set
+
+import numpy as np
+
+class CachedAnswer:
+    def __init__(self, query: str, embedding: np.ndarray, scope: Hashable, citations: List[dict], answer: str, ttl: Optional[float]):
+        self.query = query
+        self.embedding = embedding
+        self.scope = scope
+        self.citations = citations
+        self.answer = answer
+        self.doc_ids = {c.get("doc_id") for c in citations}
+        self.expires = time.monotonic() + ttl if ttl else None
+
+class AnswerCache:
+    """
+    Semantic answer cache: a new question reuses a stored answer when its embedding is
+    within `threshold` cosine similarity of a cached question asked under the same scope
+    (model, filters...).
+
+    Entries are dropped when any document they cite changes. Entries that cited nothing
+    are dropped on every write, since new content may now answer them.
+    """
+    def __init__(self, maxsize: int, threshold: float, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding: List[float], scope: Hashable) -> Optional[CachedAnswer]:
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.monotonic()
+
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.expires is not None and e.expires <= now]:
+                del self._entries[key]
+
+            candidates = [(k, e) for k, e in self._entries.items() if e.scope == scope]
+            if candidates:
+                matrix = np.stack([e.embedding for _, e in candidates])
+                sims = matrix @ query
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(self, query: str, embedding: List[float], scope: Hashable, citations: List[dict], answer: str):
+        if self.maxsize <= 0:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[self._next_id] = CachedAnswer(query, vector, scope, citations, answer, self.ttl)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, doc_ids: Optional[Set[str]] = None):
+        with self._lock:
+            if doc_ids is None:
+                self._entries.clear()
+                return
+            stale = [k for k, e in self._entries.items() if not e.doc_ids or e.doc_ids & doc_ids]
+            for key in stale:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from .config import settings
+from .index_service import index
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+class MicroBatcher:
+    """
+    Coalesces concurrent model calls into one forward pass.
+
+    Each submit() carries a list of items. Requests are collected for up to
+    max_wait_ms (or until max_batch_size items are pending), then fn runs once over
+    all of them on a dedicated worker thread and every caller gets its slice back.
+    While a batch is running the next one accumulates, so under load batches grow
+    on their own instead of N tiny passes competing for the same cores.
+    """
+    def __init__(self, name: str, fn: Callable[[list], list], max_batch_size: int, max_wait_ms: float):
+        self.name = name
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{name}")
+        self._pending: List[Tuple[list, asyncio.Future]] = []
+        self._pending_items = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.items = 0
+        self.in_flight = 0
+        self.largest_batch = 0
+        self.batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+
+    async def submit(self, items: list) -> list:
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((items, future))
+        self._pending_items += len(items)
+        self.requests += 1
+
+        if self._pending_items >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Take whole requests up to max_batch_size items (always at least one request)
+        batch, size = [], 0
+        while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+            items, future = self._pending.pop(0)
+            batch.append((items, future))
+            size += len(items)
+        self._pending_items -= size
+
+        loop = asyncio.get_running_loop()
+        if self._pending:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        if batch:
+            loop.create_task(self._run(batch, size))
+
+    async def _run(self, batch: List[Tuple[list, asyncio.Future]], size: int):
+        self.batches += 1
+        self.items += size
+        self.in_flight += 1
+        self.largest_batch = max(self.largest_batch, size)
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+        self.batch_size_counts[bucket] += 1
+
+        all_items = [item for items, _ in batch for item in items]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._executor, self.fn, all_items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+
+        offset = 0
+        for items, future in batch:
+            # The caller may have gone away (cancelled) while the batch was running
+            if not future.done():
+                future.set_result(results[offset:offset + len(items)])
+            offset += len(items)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._pending_items,
+            "in_flight_batches": self.in_flight,
+            "requests": self.requests,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "batch_size_histogram": {f"le_{b}": n for b, n in self.batch_size_counts.items()},
+        }
+
+embedding_batcher = MicroBatcher(
+    "embed",
+    lambda texts: index.embed(texts),
+    max_batch_size=settings.EMBED_MAX_BATCH_SIZE,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS
+)
+
+rerank_batcher = MicroBatcher(
+    "rerank",
+    lambda pairs: index.rerank(pairs),
+    max_batch_size=settings.RERANK_MAX_BATCH_SIZE,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS
+)
@@ -0,0 +1,336 @@
+"""
+Bulk ingestion of a directory tree, for document shares too large to upload file by file.
+
+    python -m backend.bulk_ingest /mnt/share --workers 8 [--workspace legal]
+
+Files are hashed and extracted in worker processes, chunked here, embedded in large
+batches and written with one upsert per batch. A checkpoint manifest records every
+finished file with its size and mtime, so an interrupted run resumes where it stopped
+without reading finished files again. Filenames are paths relative to the directory.
+
+Only one process may write a data directory. If a server already holds it, the store
+is left alone: the embedded chunks are posted to the server's /api/chunks endpoint and
+written by its indexer thread.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+
+from .config import settings
+from .models import BulkDocument, BulkIngestRequest, BulkIngestResponse, Chunk
+from .ingestion import ingestion_service, hash_file, document_id, SUPPORTED_EXTENSIONS
+from .page_cache import PageTextCache
+from .writer_lock import WriterLock
+from .workspaces import DEFAULT_WORKSPACE, validate_workspace
+
+class Manifest:
+    """
+    Checkpoint of a bulk run: one row per file (done, unchanged or failed) with the size
+    and mtime it had at the time.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, "
+            "file_hash TEXT, status TEXT NOT NULL, chunks INTEGER NOT NULL, error TEXT, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def entries(self) -> Dict[str, Tuple[int, float, str]]:
+        rows = self._db.execute("SELECT filename, size, mtime, status FROM files")
+        return {filename: (size, mtime, status) for filename, size, mtime, status in rows}
+
+    def record(self, rows: List[tuple]):
+        """
+        Stores (filename, size, mtime, file_hash, status, chunks, error) rows.
+        """
+        self._db.executemany(
+            "INSERT OR REPLACE INTO files (filename, size, mtime, file_hash, status, chunks, error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [row + (time.time(),) for row in rows]
+        )
+        self._db.commit()
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+def walk(root: str) -> Iterator[Tuple[str, str, int, float]]:
+    """
+    (path, filename relative to root, size, mtime) of every supported file, in a stable order.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith(".") or os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            stat = os.stat(path)
+            yield path, os.path.relpath(path, root).replace(os.sep, "/"), stat.st_size, stat.st_mtime
+
+_page_cache: Optional[PageTextCache] = None
+
+def extract_file(path: str, filename: str, indexed_hash: Optional[str]) -> Tuple[str, Optional[List[Tuple[str, int]]]]:
+    """
+    Runs in a worker process: (file_hash, cleaned pages), or (file_hash, None) if the
+    file is the revision already indexed. Goes through the page text cache.
+    """
+    global _page_cache
+    file_hash = hash_file(path)
+    if file_hash == indexed_hash:
+        return file_hash, None
+
+    if settings.PAGE_TEXT_CACHE_ENABLED and _page_cache is None:
+        _page_cache = PageTextCache(settings.PAGE_TEXT_CACHE_PATH, settings.PAGE_TEXT_CACHE_MAX_PAGES)
+    raw = None
+    if _page_cache is not None:
+        total = _page_cache.page_count(file_hash)
+        if total is not None:
+            cached = _page_cache.get(file_hash, 1, total)
+            if len(cached) == total:
+                raw = sorted(cached.items())
+    if raw is None:
+        rows = list(ingestion_service._extract_raw(path, filename))
+        if _page_cache is not None:
+            _page_cache.put(file_hash, rows)
+            _page_cache.set_page_count(file_hash, len(rows))
+        raw = [(page, text) for page, text, _ in rows]
+
+    pages = []
+    for page, raw_text in raw:
+        text = ingestion_service.clean_page(raw_text)
+        if text:
+            pages.append((text, page))
+    return file_hash, pages
+
+class LocalStore:
+    """
+    Writes straight into the workspace's store; this process holds the writer lock.
+    """
+    def __init__(self, workspace: str):
+        from .workspaces import workspaces
+        self.workspaces = workspaces
+        self.workspace = workspace
+
+    def indexed(self) -> Dict[str, str]:
+        with self.workspaces.use(self.workspace, create=True) as store:
+            return {d.doc_id: d.file_hash for d in store.registry.list()}
+
+    def stored_ids(self, doc_id: str) -> Set[str]:
+        with self.workspaces.use(self.workspace, create=True) as store:
+            return store.document_chunk_ids(doc_id)
+
+    def write(self, documents: List[BulkDocument]) -> BulkIngestResponse:
+        with self.workspaces.use(self.workspace, create=True) as store:
+            return store.write_documents(documents)
+
+class RemoteStore:
+    """
+    Hands documents to the server that holds the writer lock.
+    """
+    def __init__(self, url: str, workspace: str):
+        self.client = httpx.Client(base_url=url, timeout=httpx.Timeout(600.0))
+        self.workspace = workspace
+
+    def indexed(self) -> Dict[str, str]:
+        r = self.client.get("/api/documents", params={"workspace": self.workspace})
+        if r.status_code == 404:
+            # The workspace is created by the first write
+            return {}
+        r.raise_for_status()
+        return {d["doc_id"]: d["file_hash"] for d in r.json()}
+
+    def stored_ids(self, doc_id: str) -> Set[str]:
+        r = self.client.get(f"/api/documents/{doc_id}/chunk_ids", params={"workspace": self.workspace})
+        if r.status_code == 404:
+            # The workspace is created by the first write
+            return set()
+        r.raise_for_status()
+        return set(r.json())
+
+    def write(self, documents: List[BulkDocument]) -> BulkIngestResponse:
+        body = BulkIngestRequest(model=settings.EMBEDDING_MODEL, documents=documents, workspace=self.workspace)
+        r = self.client.post("/api/chunks", content=body.model_dump_json(), headers={"Content-Type": "application/json"})
+        r.raise_for_status()
+        return BulkIngestResponse(**r.json())
+
+class Progress:
+    """
+    Throughput and an ETA from bytes processed, printed every `interval` seconds.
+    """
+    def __init__(self, files: int, total_bytes: int, interval: float):
+        self.files, self.total_bytes, self.interval = files, total_bytes, interval
+        self.done = self.bytes = self.pages = self.chunks = 0
+        self.started = self.reported = time.monotonic()
+
+    def add(self, size: int, pages: int = 0, chunks: int = 0):
+        self.done += 1
+        self.bytes += size
+        self.pages += pages
+        self.chunks += chunks
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        self.reported = time.monotonic()
+        elapsed = max(self.reported - self.started, 1e-6)
+        rate = self.bytes / elapsed
+        eta = (self.total_bytes - self.bytes) / rate if rate else float("inf")
+        print(
+            f"{self.done}/{self.files} files | {self.pages / elapsed:.1f} pages/s | "
+            f"{self.chunks / elapsed:.1f} chunks/s | {rate / 1e6:.2f} MB/s | ETA {_duration(eta)}",
+            flush=True
+        )
+
+def _duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def ingest(root: str, manifest: Manifest, store, workers: int, batch_chunks: int,
+           retry_failed: bool = False, report_every: float = 10.0) -> Dict[str, int]:
+    from .embeddings import embedding_model
+
+    entries = manifest.entries()
+    pending = []
+    for path, filename, size, mtime in walk(root):
+        previous = entries.get(filename)
+        if previous and previous[:2] == (size, mtime) and (previous[2] != "failed" or not retry_failed):
+            continue
+        pending.append((path, filename, size, mtime))
+    indexed = store.indexed()
+    print(f"{len(pending)} files to ingest ({len(entries)} in the manifest already).")
+    if not pending:
+        return manifest.summary()
+
+    progress = Progress(len(pending), sum(item[2] for item in pending), report_every)
+    batch: List[Tuple[tuple, str, int, List[Chunk]]] = []
+
+    def flush():
+        if not batch:
+            return
+        # One embedding call for every new chunk in the batch
+        fresh = []
+        for (_, filename, _, _), _, _, chunks in batch:
+            stored = store.stored_ids(document_id(filename))
+            fresh.extend(c for c in chunks if c.id not in stored)
+        vectors = dict(zip((c.id for c in fresh), embedding_model.generate([c.text for c in fresh])))
+
+        store.write([
+            BulkDocument(
+                filename=filename, file_hash=file_hash, chunks=chunks,
+                embeddings={c.id: vectors[c.id] for c in chunks if c.id in vectors}
+            )
+            for (_, filename, _, _), file_hash, _, chunks in batch
+        ])
+        manifest.record([
+            (filename, size, mtime, file_hash, "done", len(chunks), None)
+            for (_, filename, size, mtime), file_hash, _, chunks in batch
+        ])
+        for (_, _, size, _), _, pages, chunks in batch:
+            progress.add(size, pages, len(chunks))
+        batch.clear()
+
+    # Spawn (not fork), same as the server's extraction pool
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    todo = iter(pending)
+    in_flight = deque()
+
+    def submit_next():
+        item = next(todo, None)
+        if item is not None:
+            path, filename = item[:2]
+            in_flight.append((item, pool.submit(extract_file, path, filename, indexed.get(document_id(filename)))))
+
+    try:
+        # Two files per worker keeps them busy while this process embeds
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            item, future = in_flight.popleft()
+            submit_next()
+            _, filename, size, mtime = item
+            try:
+                file_hash, pages = future.result()
+                if pages is None:
+                    manifest.record([(filename, size, mtime, file_hash, "unchanged", 0, None)])
+                    progress.add(size)
+                    continue
+                chunks = list(ingestion_service.chunk_pages(pages, filename, document_id(filename)))
+                if not chunks:
+                    raise ValueError("No text could be extracted from this document.")
+            except Exception as e:
+                print(f"Failed {filename}: {e}")
+                manifest.record([(filename, size, mtime, None, "failed", 0, str(e))])
+                progress.add(size)
+                continue
+
+            batch.append((item, file_hash, len(pages), chunks))
+            if sum(len(c) for _, _, _, c in batch) >= batch_chunks:
+                flush()
+        flush()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    progress.report()
+    return manifest.summary()
+
+def default_manifest(root: str, workspace: str = DEFAULT_WORKSPACE) -> str:
+    # One manifest per source directory and workspace, next to the data it describes
+    source = os.path.abspath(root) if workspace == DEFAULT_WORKSPACE else f"{workspace}:{os.path.abspath(root)}"
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(settings.DATA_DIR, "bulk_ingest", f"{key}.sqlite")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Extraction processes")
+    parser.add_argument("--batch-chunks", type=int, default=1024, help="Chunks embedded and written per batch")
+    parser.add_argument("--workspace", default=DEFAULT_WORKSPACE, help="Workspace to ingest into (created if new)")
+    parser.add_argument("--manifest", help="Checkpoint file (default: DATA_DIR/bulk_ingest/<dir hash>.sqlite)")
+    parser.add_argument("--server", default="http://localhost:8000", help="Used when a running server holds the data directory")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in an earlier run")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    try:
+        validate_workspace(args.workspace)
+    except ValueError as e:
+        parser.error(str(e))
+
+    lock = WriterLock(settings.WRITER_LOCK_PATH)
+    if lock.acquire("bulk_ingest"):
+        store = LocalStore(args.workspace)
+    else:
+        print(f"{settings.DATA_DIR} is held by {lock.holder()}; sending chunks to {args.server}.")
+        # The server owns the embedding cache files as well
+        settings.EMBEDDING_CACHE_ENABLED = False
+        store = RemoteStore(args.server, args.workspace)
+
+    manifest_path = args.manifest or default_manifest(args.directory, args.workspace)
+    print(f"Checkpoint manifest: {manifest_path}")
+    try:
+        summary = ingest(
+            args.directory, Manifest(manifest_path), store, args.workers, args.batch_chunks,
+            retry_failed=args.retry_failed, report_every=args.report_every
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+        return
+    finally:
+        lock.release()
+    print(f"Manifest: {summary}")
+
+if __name__ == "__main__":
+    main()
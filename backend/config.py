@@ -1,25 +1,157 @@
 import os
+from typing import Dict, List, Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
+# Paths that follow BASE_DIR / DATA_DIR unless set themselves, in dependency order
+DERIVED_PATHS = (
+    ("DOCS_DIR", "BASE_DIR", "docs"),
+    ("DATA_DIR", "BASE_DIR", "data"),
+    ("CHROMA_DB_PATH", "DATA_DIR", "chroma"),
+    ("EMBEDDING_CACHE_DIR", "DATA_DIR", "embedding_cache"),
+    ("BM25_INDEX_PATH", "DATA_DIR", "bm25.sqlite"),
+    ("REGISTRY_PATH", "DATA_DIR", "documents.sqlite"),
+    ("NUMPY_INDEX_PATH", "DATA_DIR", "numpy_index"),
+    ("PROFILE_DIR", "DATA_DIR", "profiles"),
+    ("PAGE_TEXT_CACHE_PATH", "DATA_DIR", "page_text.sqlite"),
+    ("WRITER_LOCK_PATH", "DATA_DIR", ".writer.lock"),
+    ("WORKSPACES_DIR", "DATA_DIR", "workspaces"),
+)
+
 class Settings(BaseSettings):
     # Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     DOCS_DIR: str = os.path.join(BASE_DIR, "docs")
-    CHROMA_DB_PATH: str = os.path.join(BASE_DIR, "data", "chroma")
+    DATA_DIR: str = os.path.join(BASE_DIR, "data")
+    CHROMA_DB_PATH: str = os.path.join(DATA_DIR, "chroma")
+    EMBEDDING_CACHE_DIR: str = os.path.join(DATA_DIR, "embedding_cache")
+    BM25_INDEX_PATH: str = os.path.join(DATA_DIR, "bm25.sqlite")
+    REGISTRY_PATH: str = os.path.join(DATA_DIR, "documents.sqlite")
+    NUMPY_INDEX_PATH: str = os.path.join(DATA_DIR, "numpy_index")
+    PROFILE_DIR: str = os.path.join(DATA_DIR, "profiles")
+    PAGE_TEXT_CACHE_PATH: str = os.path.join(DATA_DIR, "page_text.sqlite")
+    WRITER_LOCK_PATH: str = os.path.join(DATA_DIR, ".writer.lock")
+    WORKSPACES_DIR: str = os.path.join(DATA_DIR, "workspaces")  # Registry and BM25 index of non-default workspaces
     
     # Models
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     DEFAULT_LLM_MODEL: str = "gemma2:2b"
     OLLAMA_BASE_URL: str = "http://127.0.0.1:11434"
+    OLLAMA_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_READ_TIMEOUT: float = 300.0  # Max wait between streamed lines (prompt processing on CPU is slow)
+    OLLAMA_MAX_CONNECTIONS: int = 16
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps the model loaded after a request
+
+    # LLM Admission (per model and API process; keep the sum within OLLAMA_NUM_PARALLEL)
+    LLM_MAX_CONCURRENT: int = 1  # Answer generations at once per model; 0 = unlimited
+    LLM_MODEL_CONCURRENCY: Dict[str, int] = {}  # Per-model overrides, e.g. {"llama3": 2}
+    LLM_MAX_CONCURRENT_REWRITES: int = 1  # Query rewrites have their own slots, so they never wait behind answers
+    LLM_MAX_QUEUE: int = 32  # Waiting calls per model and kind; beyond that requests are rejected (503)
+    LLM_QUEUE_TIMEOUT: float = 120.0  # Seconds a call may wait for a slot
+    LLM_TRUSTED_USER_HOSTS: List[str] = []  # Client addresses (a frontend or gateway) whose "user" field is believed
+
+    # Startup
+    WARMUP_ON_STARTUP: bool = True  # Load models in the background right after startup
+    WARMUP_RERANKER: bool = True
+    WARMUP_LLM: bool = True  # Preload DEFAULT_LLM_MODEL into Ollama
+    WARMUP_RETRY_SECONDS: float = 5.0  # First retry of a failed warm-up, doubling each time; 0 = don't retry
+    WARMUP_RETRY_MAX_SECONDS: float = 300.0
+
+    # Index Service (multi-worker serving)
+    INDEX_SERVICE_ADDRESS: str = ""  # Unix socket of `python -m backend.index_service`; empty = in-process
+    INDEX_SERVICE_AUTHKEY: str = "local-rag"
+
+    # Workspaces (one collection + indexes each, opened on demand)
+    WORKSPACE_MAX_OPEN: int = 16  # Open workspaces kept around; least recently used are closed first
+    WORKSPACE_MEMORY_MB: int = 2048  # Estimated vector + graph memory of open workspaces before evicting
+
+    # Observability (stage histograms are always on, at /metrics)
+    PROFILE_SLOW_REQUESTS: bool = False  # Sample stacks during queries, keep them for slow ones
+    PROFILE_SAMPLE_RATE: float = 0.1  # Fraction of queries that get profiled
+    PROFILE_INTERVAL_MS: float = 10.0
+    SLOW_REQUEST_SECONDS: float = 10.0
+
+    # Vector Backend
+    VECTOR_BACKEND: str = "chroma"  # "chroma" (HNSW) or "numpy" (exact search, memory-mapped)
+    NUMPY_INDEX_DTYPE: str = "float32"  # "float16" halves the index size but scans are slower (upcast per query)
+    # Chroma HNSW graph; M and CONSTRUCTION_EF only take effect for a new (or reset) collection.
+    # None keeps Chroma's defaults. Tune with `python -m benchmarks.retrieval_eval`.
+    HNSW_M: Optional[int] = None
+    HNSW_CONSTRUCTION_EF: Optional[int] = None
+    HNSW_SEARCH_EF: Optional[int] = None
+
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000
+    EMBEDDING_CACHE_DTYPE: str = "float16"  # or float32
     
     # RAG Parameters
+    CHUNKING_STRATEGY: str = "characters"  # "characters" (fixed windows) or "tokens" (sentence/paragraph aware)
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 100
-    TOP_K_RETRIEVAL: int = 15
+    CHUNK_TOKENS: int = 200  # "tokens" strategy: embedding-tokenizer tokens per chunk (capped at the model's window)
+    CHUNK_OVERLAP_TOKENS: int = 0  # Trailing whole sentences carried into the next chunk, up to this many tokens
+    TOP_K_RETRIEVAL: int = 15  # Chunks kept after reranking
+    RETRIEVAL_CANDIDATES: int = 45  # Chunks fetched per search (dense and BM25 each)
+    RERANK_DEPTH: int = 45  # How many of the fused candidates go through the cross-encoder
+    CONTEXT_TOKEN_BUDGET: int = 2048  # Max tokens of retrieved context in the prompt
+    LLM_TOKENIZER: Optional[str] = None  # HF tokenizer matching the Ollama model; estimated from length if unset
+
+    # Document Routing (coarse-to-fine: pick documents by centroid, then search their chunks)
+    DOC_ROUTING: bool = False
+    ROUTING_TOP_DOCS: int = 20
+    ROUTING_MIN_DOCS: int = 200  # Below this many documents a flat search is cheap enough
+
+    # Hybrid Search (BM25 + vectors, merged by reciprocal rank fusion)
+    HYBRID_SEARCH: bool = True
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    RRF_K: int = 60
+
+    # Query Rewriting
+    SKIP_SELF_CONTAINED_REWRITE: bool = True  # Only rewrite follow-ups that reference the conversation
+    SPECULATIVE_RETRIEVAL: bool = True  # Retrieve for the raw query while the rewrite runs
+    REWRITE_REUSE_THRESHOLD: float = 0.9  # Cosine similarity above which speculative results are reused
+
+    # Micro-batching (embedding & reranking across concurrent queries)
+    BATCH_MAX_WAIT_MS: float = 5.0
+    EMBED_MAX_BATCH_SIZE: int = 64
+    RERANK_MAX_BATCH_SIZE: int = 256
+
+    # Query Caches (rewrite, query embedding, rerank scores)
+    QUERY_CACHE_SIZE: int = 1024
+    QUERY_CACHE_TTL: int = 600  # Seconds
+
+    # Semantic Answer Cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_THRESHOLD: float = 0.95  # Cosine similarity for a paraphrase to reuse an answer
+    ANSWER_CACHE_TTL: int = 3600  # Seconds
+
+    # Ingestion Jobs
+    MAX_UPLOAD_MB: int = 200
+    INGEST_WORKERS: int = 2  # Processes used for PDF/DOCX text extraction
+    JOBS_KEEP_FINISHED: int = 1000  # Finished jobs kept for /api/jobs; older ones are forgotten
+    EMBED_BATCH_SIZE: int = 64
+    PAGE_BATCH_SIZE: int = 16  # Pages handed to an extraction worker at a time
+    INGEST_PREFETCH_BATCHES: int = 2  # Page batches extracted ahead of the embedder (backpressure)
+    PAGE_TEXT_CACHE_ENABLED: bool = True  # Keep extracted page text so re-ingestion skips parsing
+    PAGE_TEXT_CACHE_MAX_PAGES: int = 200_000  # Least recently used files are dropped past this
+    SLOW_PAGE_SECONDS: float = 2.0  # Pages slower than this to extract are logged
 
     class Config:
         env_file = ".env"
 
+    @model_validator(mode="after")
+    def derive_paths(self):
+        # The defaults above are computed at class definition; re-derive the unset ones
+        # so that setting DATA_DIR alone moves every store and cache with it
+        for name, parent, leaf in DERIVED_PATHS:
+            if name not in self.model_fields_set:
+                setattr(self, name, os.path.join(getattr(self, parent), leaf))
+        return self
+
 settings = Settings()
 
 # Ensure dirs exist
@@ -0,0 +1,132 @@
+import threading
+from typing import List, Optional, Tuple
+from .config import settings
+from .models import RetrievalResult
+
+MAX_OVERLAP_CHARS = 1000
+
+def _overlap(a: str, b: str) -> int:
+    """
+    Length of the longest suffix of a that is also a prefix of b.
+    """
+    for k in range(min(len(a), len(b), MAX_OVERLAP_CHARS), 0, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+class SourceSpan:
+    """
+    A run of consecutive chunks from one document, merged into a single excerpt.
+    """
+    def __init__(self, doc: RetrievalResult):
+        self.docs = [doc]
+        self.text = doc.excerpt
+
+    @property
+    def first(self) -> RetrievalResult:
+        return self.docs[0]
+
+    @property
+    def last(self) -> RetrievalResult:
+        return self.docs[-1]
+
+    @property
+    def score(self) -> float:
+        return max(d.score for d in self.docs)
+
+    def extend(self, doc: RetrievalResult):
+        k = _overlap(self.text, doc.excerpt)
+        self.text += doc.excerpt[k:] if k else " " + doc.excerpt
+        self.docs.append(doc)
+
+    def render(self, text: Optional[str] = None) -> str:
+        pages = f"Page {self.first.page}"
+        if self.last.page != self.first.page:
+            pages = f"Pages {self.first.page}-{self.last.page}"
+        return f"-- Source: {self.first.filename} ({pages})\n{text or self.text}\n\n"
+
+class ContextAssembler:
+    """
+    Packs reranked chunks into the prompt's context block.
+
+    Consecutive chunks of a document are merged with their overlap removed, the best
+    spans are kept until CONTEXT_TOKEN_BUDGET is spent, and the kept spans are laid
+    out in document order. The layout only depends on which sources were kept, not on
+    their rerank order, so repeated questions reuse Ollama's cached prompt prefix.
+    """
+    def __init__(self):
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._lock = threading.Lock()
+
+    def _load_tokenizer(self):
+        if not self._tokenizer_loaded:
+            with self._lock:
+                if not self._tokenizer_loaded:
+                    if settings.LLM_TOKENIZER:
+                        try:
+                            from transformers import AutoTokenizer
+                            self._tokenizer = AutoTokenizer.from_pretrained(settings.LLM_TOKENIZER)
+                        except Exception as e:
+                            print(f"Could not load tokenizer {settings.LLM_TOKENIZER}, estimating token counts: {e}")
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        tokenizer = self._load_tokenizer()
+        if tokenizer is None:
+            # Roughly 4 characters per token for English text
+            return len(text) // 4 + 1
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokenizer = self._load_tokenizer()
+        if tokenizer is None:
+            return text[:max_tokens * 4]
+        ids = tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        return tokenizer.decode(ids)
+
+    def _merge(self, docs: List[RetrievalResult]) -> List[SourceSpan]:
+        unique = {}
+        for doc in docs:
+            unique.setdefault(doc.chunk_id or id(doc), doc)
+        ordered = sorted(unique.values(), key=lambda d: (d.filename, d.doc_id or "", d.chunk_index))
+
+        spans: List[SourceSpan] = []
+        for doc in ordered:
+            prev = spans[-1].last if spans else None
+            if prev is not None and prev.doc_id == doc.doc_id and prev.filename == doc.filename and doc.chunk_index == prev.chunk_index + 1:
+                spans[-1].extend(doc)
+            else:
+                spans.append(SourceSpan(doc))
+        return spans
+
+    def build(self, docs: List[RetrievalResult], budget: Optional[int] = None) -> Tuple[str, List[RetrievalResult]]:
+        """
+        Returns the context block and the chunks that made it in.
+        """
+        budget = budget or settings.CONTEXT_TOKEN_BUDGET
+        spans = self._merge(docs)
+
+        # Fill the budget best-first...
+        kept, truncated = [], {}
+        remaining = budget
+        for span in sorted(spans, key=lambda s: s.score, reverse=True):
+            cost = self.count_tokens(span.render())
+            if cost <= remaining:
+                kept.append(span)
+                remaining -= cost
+        if not kept and spans:
+            # Even the best span is over budget on its own: keep a truncated copy of it
+            best = max(spans, key=lambda s: s.score)
+            header = self.count_tokens(best.render(" "))
+            truncated[id(best)] = self._truncate(best.text, max(budget - header, 1))
+            kept.append(best)
+
+        # ...then lay out in document order for a stable prompt prefix
+        kept.sort(key=lambda s: (s.first.filename, s.first.doc_id or "", s.first.chunk_index))
+        context_block = "".join(span.render(truncated.get(id(span))) for span in kept)
+        used = [doc for span in kept for doc in span.docs]
+        return context_block, used
+
+context_assembler = ContextAssembler()
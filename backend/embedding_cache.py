@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+def normalize_text(text: str) -> str:
+    # Whitespace / unicode variants of the same passage should share one vector
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache for a single model.
+
+    Vectors live in a fixed-capacity memory-mapped matrix (vectors.bin) and a SQLite
+    index maps text hash -> row. When the matrix is full, the least recently used
+    rows are recycled.
+    """
+    EVICT_FRACTION = 0.05
+
+    def __init__(self, directory: str, dim: int, capacity: int, dtype: str = "float16"):
+        self.directory = directory
+        self.dim = dim
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._index_path = os.path.join(directory, "index.sqlite")
+
+        meta = {"dim": dim, "capacity": capacity, "dtype": self.dtype.name}
+        if self._read_meta() != meta:
+            # Layout changed (new model dim, dtype or size): start over rather than misread rows
+            for path in (self._vectors_path, self._index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            with open(self._meta_path, "w") as f:
+                json.dump(meta, f)
+
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode, shape=(capacity, dim))
+
+        self._db = sqlite3.connect(self._index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.commit()
+
+        self._slots: Dict[str, int] = dict(self._db.execute("SELECT key, slot FROM entries"))
+        used = set(self._slots.values())
+        self._free = [s for s in range(capacity - 1, -1, -1) if s not in used]
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            found = []
+            hit_keys = []
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    found.append(None)
+                else:
+                    found.append(np.array(self._vectors[slot], dtype=np.float32))
+                    hit_keys.append(key)
+
+            self.hits += len(hit_keys)
+            self.misses += len(keys) - len(hit_keys)
+            if hit_keys:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in hit_keys])
+                self._db.commit()
+            return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        with self._lock:
+            rows = {}
+            for key, vector in zip(keys, vectors):
+                if key in self._slots or key in rows:
+                    continue
+                if not self._free:
+                    self._evict(max(1, int(self.capacity * self.EVICT_FRACTION)))
+                    if not self._free:
+                        # Every slot now holds this batch: the rest of it just isn't cached
+                        break
+                slot = self._free.pop()
+                self._vectors[slot] = vector
+                rows[key] = slot
+
+            if not rows:
+                return
+            # Vectors hit the disk before the index points at them
+            self._vectors.flush()
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(k, s, now) for k, s in rows.items()]
+            )
+            self._db.commit()
+            self._slots.update(rows)
+
+    def _evict(self, n: int):
+        victims = self._db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (n,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+        self._db.commit()
+        for key, slot in victims:
+            self._slots.pop(key, None)
+            self._free.append(slot)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -1,16 +1,87 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+import os
+import threading
+import numpy as np
+from typing import List, Tuple
 from .config import settings
+from .embedding_cache import EmbeddingCache, text_key, model_slug
 
 class EmbeddingModel:
     def __init__(self):
-        print(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-        self.model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        # Nothing heavy here: torch and the weights load on first use or at warm-up
+        self._model = None
+        self.cache = None
+        self._lock = threading.Lock()
 
-    def generate(self, texts: List[str]) -> List[List[float]]:
-        # Generate embeddings
-        embeddings = self.model.encode(texts)
-        return embeddings.tolist()
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
+                    model = SentenceTransformer(settings.EMBEDDING_MODEL)
+
+                    if settings.EMBEDDING_CACHE_ENABLED:
+                        self.cache = EmbeddingCache(
+                            os.path.join(settings.EMBEDDING_CACHE_DIR, model_slug(settings.EMBEDDING_MODEL)),
+                            dim=model.get_sentence_embedding_dimension(),
+                            capacity=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                            dtype=settings.EMBEDDING_CACHE_DTYPE
+                        )
+                    self._model = model
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def warmup(self):
+        # One tiny forward pass so the first real query doesn't pay for lazy init
+        self.model.encode(["warm-up"])
+
+    @property
+    def max_tokens(self) -> int:
+        # The encoder's window, less the [CLS]/[SEP] it adds
+        return self.model.max_seq_length - 2
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [max(1, len(t) // 4) for t in texts]
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def token_offsets(self, text: str) -> List[Tuple[int, int]]:
+        """
+        (start, end) character offsets of each token, estimated like count_tokens when the
+        model has no fast tokenizer.
+        """
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None or not getattr(tokenizer, "is_fast", False):
+            return [(i, min(i + 4, len(text))) for i in range(0, len(text), 4)]
+        return tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+    def generate(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        if not texts:
+            return []
+        model = self.model
+        if self.cache is None or not use_cache:
+            return model.encode(texts).tolist()
+
+        # Look the whole batch up first, only encode the misses
+        keys = [text_key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(cached) if v is None]
+
+        if missing:
+            fresh = model.encode([texts[i] for i in missing])
+            self.cache.put_many([keys[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                cached[i] = vector
+
+        return np.asarray(cached, dtype=np.float32).tolist()
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
 
 # Singleton
 embedding_model = EmbeddingModel()
@@ -0,0 +1,244 @@
+"""
+The index service: everything that holds model weights or writes the store.
+
+By default it runs inside the API process. For multi-worker serving, run it once on
+its own and point the workers at it:
+
+    INDEX_SERVICE_ADDRESS=/tmp/rag-index.sock python -m backend.index_service
+    INDEX_SERVICE_ADDRESS=/tmp/rag-index.sock uvicorn backend.server:app --workers 4
+
+The workers then only handle HTTP, prompting and LLM streaming. Embedding, reranking,
+retrieval, the document registry and ingestion jobs live in the one service process,
+so model memory is paid once and the store has a single writer.
+"""
+import os
+import sys
+import uuid
+import signal
+import threading
+from collections import deque
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import settings
+from .models import BulkDocument, BulkIngestResponse, DocumentInfo, IngestionJob, RetrievalResult, WorkspaceInfo
+from .embeddings import embedding_model
+from .reranker import reranker
+from .vector_store import vector_store
+from .workspaces import workspaces, DEFAULT_WORKSPACE
+from .jobs import job_manager
+from .writer_lock import WriterLock
+
+class IndexService:
+    """
+    Facade over the models, workspace stores and job manager. Arguments and results are
+    plain data, so the same calls work in-process and through a manager proxy.
+    """
+    CHANGE_LOG = 1024
+
+    def __init__(self):
+        self.instance = uuid.uuid4().hex
+        self._generation = 0
+        self._changes = deque(maxlen=self.CHANGE_LOG)  # (generation, doc_ids or None for everything)
+        self._lock = threading.Lock()
+        workspaces.add_listener(self._record_change)
+
+    def _record_change(self, doc_ids: Optional[Set[str]]):
+        with self._lock:
+            self._generation += 1
+            self._changes.append((self._generation, doc_ids))
+
+    def changes_since(self, instance: Optional[str], generation: int) -> Tuple[str, int, Optional[Set[str]]]:
+        """
+        (instance, generation, doc_ids written since `generation`), for invalidating caches
+        in other processes. doc_ids is None if everything should be treated as changed:
+        after a reset, a service restart, or when the caller is too far behind.
+        """
+        with self._lock:
+            if instance == self.instance and generation == self._generation:
+                return self.instance, generation, set()
+            if instance != self.instance or not self._changes or self._changes[0][0] > generation + 1:
+                return self.instance, self._generation, None
+            changed = set()
+            for gen, doc_ids in self._changes:
+                if gen <= generation:
+                    continue
+                if doc_ids is None:
+                    return self.instance, self._generation, None
+                changed |= doc_ids
+            return self.instance, self._generation, changed
+
+    # Models
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return embedding_model.generate(texts, use_cache=False)
+
+    def rerank(self, pairs: List[List[str]]) -> List[float]:
+        return reranker.predict(pairs)
+
+    def warmup(self, component: str):
+        {"vector_store": vector_store.warmup, "embedding": embedding_model.warmup, "reranker": reranker.warmup}[component]()
+
+    # Retrieval
+
+    def query(self, embedding: List[float], top_k: int, where: Optional[dict] = None, workspace: str = DEFAULT_WORKSPACE) -> List[RetrievalResult]:
+        with workspaces.use(workspace) as store:
+            return store.query(embedding, top_k=top_k, where=where)
+
+    def lexical_query(self, query: str, top_k: int, doc_ids: Optional[List[str]] = None, workspace: str = DEFAULT_WORKSPACE) -> List[RetrievalResult]:
+        with workspaces.use(workspace) as store:
+            return store.lexical_query(query, top_k=top_k, doc_ids=doc_ids)
+
+    def route(self, embedding: List[float], top_docs: int, workspace: str = DEFAULT_WORKSPACE) -> List[str]:
+        with workspaces.use(workspace) as store:
+            return store.route(embedding, top_docs)
+
+    def document_count(self, workspace: str = DEFAULT_WORKSPACE) -> int:
+        with workspaces.use(workspace) as store:
+            return store.document_count()
+
+    # Workspaces
+
+    def list_workspaces(self) -> List[WorkspaceInfo]:
+        return workspaces.list()
+
+    def has_workspace(self, workspace: str) -> bool:
+        return workspaces.exists(workspace)
+
+    # Documents
+
+    def list_documents(self, workspace: str = DEFAULT_WORKSPACE) -> List[DocumentInfo]:
+        with workspaces.use(workspace) as store:
+            return store.registry.list()
+
+    def get_document(self, doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> Optional[DocumentInfo]:
+        with workspaces.use(workspace) as store:
+            return store.registry.get(doc_id)
+
+    def document_chunk_ids(self, doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> List[str]:
+        with workspaces.use(workspace) as store:
+            return sorted(store.document_chunk_ids(doc_id))
+
+    def find_by_hash(self, file_hash: str, workspace: str = DEFAULT_WORKSPACE) -> List[DocumentInfo]:
+        with workspaces.use(workspace) as store:
+            return store.registry.find_by_hash(file_hash)
+
+    def delete_document(self, doc_id: str, workspace: str = DEFAULT_WORKSPACE):
+        job_manager.delete_document(doc_id, workspace).result()
+
+    def write_documents(self, documents: List[BulkDocument], workspace: str = DEFAULT_WORKSPACE) -> BulkIngestResponse:
+        return job_manager.write_documents(documents, workspace).result()
+
+    def reset(self, workspace: str = DEFAULT_WORKSPACE):
+        job_manager.reset(workspace).result()
+
+    # Ingestion jobs
+
+    def submit_job(self, file_path: str, filename: str, file_hash: Optional[str] = None, workspace: str = DEFAULT_WORKSPACE) -> IngestionJob:
+        return job_manager.submit(file_path, filename, file_hash=file_hash, workspace=workspace)
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return job_manager.get(job_id)
+
+    def list_jobs(self, workspace: Optional[str] = None) -> List[IngestionJob]:
+        return job_manager.list(workspace)
+
+    def cancel_job(self, job_id: str) -> bool:
+        return job_manager.cancel(job_id)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "embedding_cache": embedding_model.cache_stats(),
+            "page_text_cache": job_manager.page_cache.stats() if job_manager.page_cache else None,
+            "workspaces": workspaces.stats(),
+        }
+
+    def shutdown(self):
+        job_manager.shutdown()
+
+class IndexManager(BaseManager):
+    pass
+
+IndexManager.register("index")
+
+class IndexClient:
+    """
+    Stand-in for IndexService in API workers: every call is forwarded to the service
+    process over its socket. Connects on first use; a broken connection is dropped so
+    the next call reconnects (calls are never retried, they may not be idempotent).
+    """
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._proxy = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        with self._lock:
+            if self._proxy is None:
+                manager = IndexManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._proxy = manager.index()
+            return self._proxy
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            proxy = self._get()
+            try:
+                return getattr(proxy, name)(*args, **kwargs)
+            except (ConnectionError, EOFError):
+                self._proxy = None
+                raise
+        return call
+
+    def shutdown(self):
+        # The service outlives any one worker
+        pass
+
+def create_index():
+    if settings.INDEX_SERVICE_ADDRESS:
+        return IndexClient(settings.INDEX_SERVICE_ADDRESS, settings.INDEX_SERVICE_AUTHKEY.encode("utf-8"))
+    return IndexService()
+
+index = create_index()
+
+def serve():
+    address = settings.INDEX_SERVICE_ADDRESS
+    if not address:
+        sys.exit("Set INDEX_SERVICE_ADDRESS to the socket path the service should listen on.")
+    lock = WriterLock(settings.WRITER_LOCK_PATH)
+    if not lock.acquire("index_service"):
+        sys.exit(f"{settings.DATA_DIR} is already being written by {lock.holder()}. Stop that process or point DATA_DIR elsewhere.")
+    if os.path.exists(address):
+        # Left over from a previous run; the writer lock says nobody is serving it
+        os.remove(address)
+
+    service = IndexService()
+
+    class ServiceManager(BaseManager):
+        pass
+    ServiceManager.register("index", callable=lambda: service)
+    server = ServiceManager(address=address, authkey=settings.INDEX_SERVICE_AUTHKEY.encode("utf-8")).get_server()
+    os.chmod(address, 0o600)
+
+    if settings.WARMUP_ON_STARTUP:
+        def warm():
+            for component in ("vector_store", "embedding") + (("reranker",) if settings.WARMUP_RERANKER else ()):
+                try:
+                    service.warmup(component)
+                except Exception as e:
+                    print(f"Warm-up of {component} failed: {e}")
+        threading.Thread(target=warm, name="warmup", daemon=True).start()
+
+    # serve_forever() exits on SystemExit, so SIGTERM gets the same clean shutdown as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Index service listening on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        # The listener unlinks its own socket file
+        service.shutdown()
+        lock.release()
+
+if __name__ == "__main__":
+    serve()
@@ -1,69 +1,115 @@
 import os
-import uuid
 import re
-from typing import List, Tuple
+import math
+import time
+import hashlib
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 from .models import Chunk, DocumentMetadata
 from .config import settings
 
+# A sentence ends at terminal punctuation (plus closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_WORD = re.compile(r"\S+")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+def hash_file(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def document_id(filename: str) -> str:
+    # Stable per filename so a re-upload is recognised as a revision of the same document
+    return hashlib.sha256(filename.encode('utf-8')).hexdigest()[:16]
+
 class IngestionService:
+    def _chunk_id(self, doc_id: str, text: str) -> str:
+        return f"{doc_id}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
     def _clean_text(self, text: str) -> str:
         # Remove null bytes and excessive whitespace
         text = text.replace('\x00', '')
+        if settings.CHUNKING_STRATEGY == "tokens":
+            # The token chunker splits on paragraphs, so blank lines survive as "\n\n"
+            paragraphs = (re.sub(r'\s+', ' ', p).strip() for p in _PARAGRAPH_BREAK.split(text))
+            return "\n\n".join(p for p in paragraphs if p)
         text = re.sub(r'\s+', ' ', text).strip()
         return text
 
-    def _extract_pages(self, file_path: str, filename: str) -> List[Tuple[str, int]]:
+    def count_pages(self, file_path: str, filename: str) -> int:
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.pdf':
+            return len(PdfReader(file_path).pages)
+        if ext in ('.docx', '.txt'):
+            return 1
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    def _extract_raw(self, file_path: str, filename: str, first_page: int = 0, last_page: Optional[int] = None) -> Iterator[Tuple[int, str, float]]:
         """
-        Returns a list of (text, page_number).
-        For non-paginated formats (txt, docx), returns [(text, 1)].
+        Yields (page_number, raw_text, seconds) for every page in [first_page, last_page),
+        empty ones included. For non-paginated formats (txt, docx), yields a single page 1.
         """
         ext = os.path.splitext(filename)[1].lower()
-        pages = []
 
         try:
             if ext == '.pdf':
                 reader = PdfReader(file_path)
-                for i, page in enumerate(reader.pages):
-                    raw_text = page.extract_text()
-                    if raw_text:
-                        clean_text = self._clean_text(raw_text)
-                        if len(clean_text) > 10:  # Skip empty or very short garbage pages
-                            pages.append((clean_text, i + 1))
-            
-            elif ext == '.docx':
-                doc = DocxDocument(file_path)
-                # DOCX doesn't have strict pages, treat as one block or para-based?
-                # Treating as single page for simplicity, or we could chunk by paragraphs etc.
-                full_text = "\n".join([para.text for para in doc.paragraphs])
-                clean_text = self._clean_text(full_text)
-                if len(clean_text) > 10:
-                    pages.append((clean_text, 1))
-
-            elif ext == '.txt':
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    full_text = f.read()
-                    clean_text = self._clean_text(full_text)
-                    if len(clean_text) > 10:
-                        pages.append((clean_text, 1))
+                end = len(reader.pages) if last_page is None else min(last_page, len(reader.pages))
+                for i in range(first_page, end):
+                    start = time.perf_counter()
+                    raw_text = reader.pages[i].extract_text() or ""
+                    yield (i + 1, raw_text, time.perf_counter() - start)
+
+            elif ext in ('.docx', '.txt'):
+                if first_page > 0:
+                    return
+
+                start = time.perf_counter()
+                if ext == '.docx':
+                    doc = DocxDocument(file_path)
+                    # DOCX doesn't have strict pages, treat as one block or para-based?
+                    # Treating as single page for simplicity, or we could chunk by paragraphs etc.
+                    full_text = "\n".join([para.text for para in doc.paragraphs])
+                else:
+                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        full_text = f.read()
+                yield (1, full_text, time.perf_counter() - start)
             else:
                 raise ValueError(f"Unsupported file type: {ext}")
-                
+
         except Exception as e:
             print(f"Error reading file {filename}: {e}")
             raise e
-            
-        return pages
 
-    def chunk_text(self, text: str, filename: str, doc_id: str, page_num: int, start_idx: int) -> List[Chunk]:
+    def clean_page(self, raw_text: str) -> Optional[str]:
+        """
+        Cleaned page text, or None for empty or very short garbage pages.
+        """
+        clean_text = self._clean_text(raw_text)
+        return clean_text if len(clean_text) > 10 else None
+
+    def _extract_pages(self, file_path: str, filename: str, first_page: int = 0, last_page: Optional[int] = None) -> Iterator[Tuple[str, int]]:
+        """
+        Yields (text, page_number) for the non-empty pages in [first_page, last_page).
+        """
+        for page_num, raw_text, _ in self._extract_raw(file_path, filename, first_page, last_page):
+            clean_text = self.clean_page(raw_text)
+            if clean_text:
+                yield (clean_text, page_num)
+
+    def chunk_text(self, text: str, filename: str, doc_id: str, page_num: int, start_idx: int) -> Iterator[Chunk]:
         chunk_size = settings.CHUNK_SIZE
         overlap = settings.CHUNK_OVERLAP
-        
-        chunks = []
+
         start = 0
         text_len = len(text)
-        
+
         # If text is smaller than chunk size, just one chunk
         if text_len <= chunk_size:
             meta = DocumentMetadata(
@@ -72,49 +118,190 @@ class IngestionService:
                 doc_id=doc_id,
                 page=page_num
             )
-            chunks.append(Chunk(
-                id=f"{doc_id}-{start_idx}",
+            yield Chunk(
+                id=self._chunk_id(doc_id, text),
                 text=text,
                 metadata=meta
-            ))
-            return chunks
+            )
+            return
 
         idx = start_idx
         while start < text_len:
             end = min(start + chunk_size, text_len)
             chunk_slice = text[start:end]
-            
+
             meta = DocumentMetadata(
                 filename=filename,
                 chunk_index=idx,
                 doc_id=doc_id,
                 page=page_num
             )
-            
-            chunks.append(Chunk(
-                id=f"{doc_id}-{idx}",
+
+            yield Chunk(
+                id=self._chunk_id(doc_id, chunk_slice),
                 text=chunk_slice,
                 metadata=meta
-            ))
-            
+            )
+
             start += chunk_size - overlap
             idx += 1
-            
-        return chunks
 
-    def process_document(self, file_path: str, filename: str) -> List[Chunk]:
-        doc_id = str(uuid.uuid4())
-        pages = self._extract_pages(file_path, filename)
-        
-        all_chunks = []
+    def _sentence_spans(self, text: str) -> List[Tuple[int, int, bool]]:
+        """
+        (start, end, ends_paragraph) for every sentence, in one pass over the text.
+        """
+        spans = []
+        for para in re.finditer(r"[^\n]+", text):
+            start, end = para.start(), para.end()
+            for m in _SENTENCE_END.finditer(text, start, end):
+                spans.append((start, m.start() + len(m.group().rstrip()), False))
+                start = m.end()
+            if start < end:
+                spans.append((start, end, False))
+            if spans:
+                spans[-1] = (spans[-1][0], spans[-1][1], True)
+        return spans
+
+    def _split_long(self, text: str, spans: List[Tuple[int, int, bool]], counts: List[int], budget: int):
+        """
+        Breaks sentences longer than the budget (tables, run-on PDF text) at word boundaries,
+        and single words longer than it (URLs, encoded blobs) at token boundaries. Pieces
+        are recounted and split again until every one fits.
+        """
+        if all(n <= budget for n in counts):
+            return spans, counts
+        from .embeddings import embedding_model
+        out_spans, out_counts = [], []
+        pending = list(zip(spans, counts))[::-1]
+        while pending:
+            (start, end, ends_paragraph), n = pending.pop()
+            if n <= budget:
+                out_spans.append((start, end, ends_paragraph))
+                out_counts.append(n)
+                continue
+            words = list(_WORD.finditer(text, start, end))
+            if len(words) > 1:
+                pieces = math.ceil(n * 1.1 / budget)
+                size = math.ceil(len(words) / pieces)
+                parts = [(words[i].start(), words[min(i + size, len(words)) - 1].end()) for i in range(0, len(words), size)]
+            else:
+                offsets = embedding_model.token_offsets(text[start:end])
+                parts = [
+                    (start + offsets[i][0], start + offsets[min(i + budget, len(offsets)) - 1][1])
+                    for i in range(0, len(offsets), budget)
+                ]
+                if len(parts) == 1:
+                    if end - start < 2:
+                        out_spans.append((start, end, ends_paragraph))
+                        out_counts.append(n)
+                        continue
+                    # Estimated offsets disagree with the count: halve it instead
+                    parts = [(start, (start + end) // 2), ((start + end) // 2, end)]
+            parts = [(a, b, False) for a, b in parts]
+            parts[-1] = (parts[-1][0], parts[-1][1], ends_paragraph)
+            parts_counts = embedding_model.count_tokens([text[a:b] for a, b, _ in parts])
+            # Back on the stack in order: anything still over the budget is split again
+            pending.extend(reversed(list(zip(parts, parts_counts))))
+        return out_spans, out_counts
+
+    def chunk_text_by_tokens(self, text: str, filename: str, doc_id: str, page_num: int, start_idx: int) -> Iterator[Chunk]:
+        """
+        Packs whole sentences into chunks of at most CHUNK_TOKENS embedding-tokenizer tokens,
+        closing a chunk early at a paragraph end once it is half full. One tokenizer call
+        per page, one pass over its sentences.
+        """
+        from .embeddings import embedding_model
+        budget = min(settings.CHUNK_TOKENS, embedding_model.max_tokens)
+        spans = self._sentence_spans(text)
+        if not spans:
+            return
+        counts = embedding_model.count_tokens([text[a:b] for a, b, _ in spans])
+        spans, counts = self._split_long(text, spans, counts, budget)
+
+        idx = start_idx
+        current: List[int] = []  # Sentence indices in the open chunk
+        used = carried = 0
+
+        def emit():
+            nonlocal idx
+            chunk_text = text[spans[current[0]][0]:spans[current[-1]][1]]
+            chunk = Chunk(
+                id=self._chunk_id(doc_id, chunk_text),
+                text=chunk_text,
+                metadata=DocumentMetadata(filename=filename, chunk_index=idx, doc_id=doc_id, page=page_num)
+            )
+            idx += 1
+            return chunk
+
+        def carry_over():
+            # Trailing whole sentences (never the whole chunk) seed the next one
+            keep, tokens = [], 0
+            for i in reversed(current[1:]):
+                if tokens + counts[i] > settings.CHUNK_OVERLAP_TOKENS:
+                    break
+                keep.insert(0, i)
+                tokens += counts[i]
+            return keep, tokens
+
+        for i, n in enumerate(counts):
+            if current and used + n > budget:
+                if len(current) > carried:
+                    yield emit()
+                    current, used = carry_over()
+                    if used + n > budget:
+                        current, used = [], 0
+                else:
+                    current, used = [], 0
+                carried = len(current)
+            current.append(i)
+            used += n
+            if spans[i][2] and used >= budget // 2:
+                yield emit()
+                current, used, carried = [], 0, 0
+
+        if len(current) > carried:
+            yield emit()
+
+    def chunk_pages(self, pages: Iterable[Tuple[str, int]], filename: str, doc_id: str) -> Iterator[Chunk]:
+        """
+        Chunk ids are content hashes, so an unchanged passage keeps its id across revisions.
+        Repeated passages within a document get an occurrence suffix to stay unique.
+        """
         global_idx = 0
-        
+        occurrences = {}
+        chunker = self.chunk_text_by_tokens if settings.CHUNKING_STRATEGY == "tokens" else self.chunk_text
+
         for text, page_num in pages:
-            page_chunks = self.chunk_text(text, filename, doc_id, page_num, global_idx)
-            all_chunks.extend(page_chunks)
-            global_idx += len(page_chunks)
-            
-        print(f"Processed {filename}: {len(pages)} pages, {len(all_chunks)} chunks.")
-        return all_chunks
+            for chunk in chunker(text, filename, doc_id, page_num, global_idx):
+                seen = occurrences.get(chunk.id, 0)
+                occurrences[chunk.id] = seen + 1
+                if seen:
+                    chunk.id = f"{chunk.id}-{seen}"
+                global_idx += 1
+                yield chunk
+
+    def process_document(self, file_path: str, filename: str, doc_id: Optional[str] = None) -> Iterator[Chunk]:
+        """
+        Streams the chunks of a document page by page, nothing is held for the whole file.
+        """
+        doc_id = doc_id or document_id(filename)
+        pages = self._extract_pages(file_path, filename)
+        yield from self.chunk_pages(pages, filename, doc_id)
 
 ingestion_service = IngestionService()
+
+# Module-level entry points so extraction can be shipped to worker processes
+
+def count_pages(file_path: str, filename: str) -> int:
+    return ingestion_service.count_pages(file_path, filename)
+
+def extract_page_range(file_path: str, filename: str, first_page: int, last_page: int) -> List[Tuple[int, str, float]]:
+    return list(ingestion_service._extract_raw(file_path, filename, first_page, last_page))
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,360 @@
+import math
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+from .models import IngestionJob, BulkDocument
+from .ingestion import ingestion_service, count_pages, extract_page_range, batched, hash_file, document_id
+from .embeddings import embedding_model
+from .vector_store import VectorStore
+from .workspaces import workspaces, DEFAULT_WORKSPACE
+from .metrics import Timings, INGEST_STAGE_SECONDS, PAGE_EXTRACT_SECONDS
+from .page_cache import PageTextCache
+from .uploads import workspace_documents
+
+class JobCancelled(Exception):
+    pass
+
+class JobManager:
+    """
+    Runs uploads in the background so the API event loop never blocks on ingestion.
+
+    Text extraction goes to a process pool (pypdf is pure Python and holds the GIL),
+    embedding and upserting run on a single dedicated indexer thread so only one
+    document competes with queries for the embedding model at a time.
+
+    Each document flows through as a stream: page ranges are extracted a few batches
+    ahead of the embedder, chunked lazily and embedded/upserted in fixed-size batches,
+    so memory stays flat and early pages are searchable before the last one is parsed.
+    Extracted page text is cached by file hash, so a file is only ever parsed once.
+    """
+    def __init__(self):
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._cancelled = set()
+        self._futures: Dict[str, Future] = {}
+        self._files: Dict[str, str] = {}
+        self._finished = deque()  # Finished job ids, oldest first
+        self._lock = threading.Lock()
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+        self._page_cache: Optional[PageTextCache] = None
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexer")
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Spawn (not fork) so workers don't inherit torch / Chroma state from the API process
+        if self._extract_pool is None:
+            self._extract_pool = ProcessPoolExecutor(
+                max_workers=settings.INGEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._extract_pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        # A worker died (OOM, crashing parser): the pool is unusable, so the next job gets a fresh one
+        pool.shutdown(wait=False, cancel_futures=True)
+        if self._extract_pool is pool:
+            self._extract_pool = None
+
+    @property
+    def page_cache(self) -> Optional[PageTextCache]:
+        if not settings.PAGE_TEXT_CACHE_ENABLED:
+            return None
+        with self._lock:
+            if self._page_cache is None:
+                self._page_cache = PageTextCache(settings.PAGE_TEXT_CACHE_PATH, settings.PAGE_TEXT_CACHE_MAX_PAGES)
+        return self._page_cache
+
+    def submit(self, file_path: str, filename: str, file_hash: Optional[str] = None, workspace: str = DEFAULT_WORKSPACE) -> IngestionJob:
+        job = IngestionJob(
+            job_id=str(uuid.uuid4()),
+            filename=filename,
+            workspace=workspace,
+            created_at=time.time()
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._files[job.job_id] = file_path
+            self._futures[job.job_id] = self._indexer.submit(self._run, job, file_path, file_hash)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def list(self, workspace: Optional[str] = None) -> List[IngestionJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        jobs = [j for j in jobs if workspace is None or j.workspace == workspace]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Returns False if the job is unknown or already finished.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished_at is not None:
+                return False
+            self._cancelled.add(job_id)
+            future = self._futures.get(job_id)
+        # A queued job is dropped outright; a running one stops at its next batch
+        if future is not None and future.cancel():
+            self._finish(job, "cancelled")
+        return True
+
+    def cancel_all(self, workspace: Optional[str] = None):
+        for job in self.list(workspace):
+            self.cancel(job.job_id)
+
+    def delete_document(self, doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> Future:
+        """
+        Cancels any pending ingestion of the document, then removes it on the indexer
+        thread so the delete can't interleave with a running job's writes.
+        """
+        for job in self.list(workspace):
+            if job.finished_at is None and document_id(job.filename) == doc_id:
+                self.cancel(job.job_id)
+
+        def delete():
+            with workspaces.use(workspace) as store:
+                info = store.registry.get(doc_id)
+                store.delete_document(doc_id)
+                if info is not None:
+                    self._release_file(workspace, store, info.file_hash)
+        return self._indexer.submit(delete)
+
+    def reset(self, workspace: str = DEFAULT_WORKSPACE) -> Future:
+        """
+        Cancels the workspace's jobs, then clears it on the indexer thread, after any
+        running job has stopped, so none of its writes can land after the reset.
+        """
+        self.cancel_all(workspace)
+
+        def reset():
+            with workspaces.use(workspace) as store:
+                hashes = {info.file_hash for info in store.registry.list()}
+                store.reset()
+            if self.page_cache:
+                self.page_cache.remove(hashes)
+        return self._indexer.submit(reset)
+
+    def write_documents(self, documents: List[BulkDocument], workspace: str = DEFAULT_WORKSPACE) -> Future:
+        """
+        Bulk-ingested documents go through the indexer thread like any upload.
+        """
+        def write():
+            with workspaces.use(workspace, create=True) as store:
+                return store.write_documents(documents)
+        return self._indexer.submit(write)
+
+    def _check_cancelled(self, job: IngestionJob):
+        if job.job_id in self._cancelled:
+            raise JobCancelled()
+
+    def _finish(self, job: IngestionJob, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        with self._lock:
+            self._futures.pop(job.job_id, None)
+            self._files.pop(job.job_id, None)
+            self._cancelled.discard(job.job_id)
+            self._finished.append(job.job_id)
+            while len(self._finished) > settings.JOBS_KEEP_FINISHED:
+                self._jobs.pop(self._finished.popleft(), None)
+
+    def _release_file(self, workspace: str, store: VectorStore, file_hash: str, job: Optional[IngestionJob] = None):
+        """
+        Removes the stored upload with this hash, and its cached page text, once no
+        document in the workspace and no other pending job uses it.
+        """
+        if store.registry.find_by_hash(file_hash):
+            return
+        documents = workspace_documents(workspace)
+        path = documents.path(file_hash)
+        with self._lock:
+            if any(p == path for job_id, p in self._files.items() if job is None or job_id != job.job_id):
+                return
+        documents.remove(file_hash)
+        if self.page_cache:
+            self.page_cache.remove([file_hash])
+
+    def _iter_pages(self, job: IngestionJob, file_path: str, file_hash: str) -> Iterator[Tuple[str, int]]:
+        """
+        Yields pages in order while keeping a bounded number of page ranges in flight
+        (one per worker, or INGEST_PREFETCH_BATCHES if higher). A new range is only
+        submitted once the consumer has taken one. Ranges found in the page cache are
+        served without touching the pool.
+        """
+        pool = self._pool()
+        cache = self.page_cache
+        total = cache.page_count(file_hash) if cache else None
+        if total is None:
+            try:
+                total = pool.submit(count_pages, file_path, job.filename).result()
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                raise RuntimeError("The text extraction worker crashed on this file.")
+            if cache:
+                cache.set_page_count(file_hash, total)
+        job.pages_total = total
+
+        # Short documents are spread over all workers rather than landing on one
+        step = max(1, min(settings.PAGE_BATCH_SIZE, math.ceil(total / max(1, settings.INGEST_WORKERS))))
+        ranges = ((first, min(first + step, total)) for first in range(0, total, step))
+        in_flight = deque()
+        extracted = []
+
+        def submit_next():
+            page_range = next(ranges, None)
+            if page_range is None:
+                return
+            first, last = page_range
+            cached = cache.get(file_hash, first + 1, last) if cache else {}
+            if len(cached) == last - first:
+                future = Future()
+                future.set_result([(page, cached[page], None) for page in range(first + 1, last + 1)])
+            else:
+                future = pool.submit(extract_page_range, file_path, job.filename, first, last)
+            in_flight.append((page_range, future))
+
+        try:
+            for _ in range(max(1, settings.INGEST_PREFETCH_BATCHES, settings.INGEST_WORKERS)):
+                submit_next()
+
+            while in_flight:
+                self._check_cancelled(job)
+                (first, last), future = in_flight.popleft()
+                rows = future.result()
+                submit_next()
+
+                # Cached rows carry no timing
+                fresh = [row for row in rows if row[2] is not None]
+                if fresh and cache:
+                    cache.put(file_hash, fresh)
+                for page, _, seconds in fresh:
+                    PAGE_EXTRACT_SECONDS.observe(seconds)
+                    extracted.append((page, seconds))
+                    if seconds > settings.SLOW_PAGE_SECONDS:
+                        print(f"Slow page: {job.filename} page {page} took {seconds:.1f}s to extract.")
+                job.pages_cached += len(rows) - len(fresh)
+                job.pages_parsed += last - first
+
+                for page, raw_text, _ in rows:
+                    text = ingestion_service.clean_page(raw_text)
+                    if text:
+                        yield (text, page)
+        except BrokenProcessPool:
+            # Only this job fails; the pool is replaced for the next one
+            self._discard_pool(pool)
+            raise RuntimeError("The text extraction worker crashed on this file.")
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            # The cache remembers how long cached pages took when they were first parsed
+            slowest = cache.slowest(file_hash) if cache else sorted(extracted, key=lambda x: x[1], reverse=True)[:5]
+            job.slowest_pages = [{"page": page, "seconds": round(seconds, 3)} for page, seconds in slowest]
+
+    def _run(self, job: IngestionJob, file_path: str, file_hash: Optional[str] = None):
+        try:
+            with workspaces.use(job.workspace, create=True) as store:
+                self._index(job, store, file_path, file_hash)
+        except Exception as e:
+            print(f"Ingestion failed for {job.filename}: {e}")
+            self._finish(job, "failed", error=str(e))
+
+    def _index(self, job: IngestionJob, store: VectorStore, file_path: str, file_hash: Optional[str]):
+        added = []
+        timings = Timings(INGEST_STAGE_SECONDS)
+        try:
+            job.status = "extracting"
+            job.doc_id = document_id(job.filename)
+            # Uploads are hashed while they are written
+            file_hash = file_hash or hash_file(file_path)
+
+            if store.document_is_current(job.doc_id, file_hash):
+                print(f"Skipped {job.filename}: unchanged since last ingestion.")
+                self._finish(job, "unchanged")
+                return
+
+            # Chunk ids are content hashes: anything already stored only needs its metadata refreshed
+            existing = store.document_chunk_ids(job.doc_id)
+            seen = set()
+
+            pages = timings.timed(self._iter_pages(job, file_path, file_hash), "extract")
+            chunks = timings.timed(ingestion_service.chunk_pages(pages, job.filename, job.doc_id), "chunk")
+
+            # Embed & upsert in batches; pulling the next batch is what drives extraction
+            for batch in batched(chunks, settings.EMBED_BATCH_SIZE):
+                self._check_cancelled(job)
+                job.status = "indexing"
+                job.chunks_total += len(batch)
+                seen.update(c.id for c in batch)
+
+                known = [c for c in batch if c.id in existing]
+                fresh = [c for c in batch if c.id not in existing]
+                with timings.span("upsert"):
+                    store.update_chunk_metadata(known)
+                job.chunks_unchanged += len(known)
+
+                if fresh:
+                    with timings.span("embed"):
+                        embeddings = embedding_model.generate([c.text for c in fresh])
+                    with timings.span("upsert"):
+                        store.upsert_chunks(fresh, embeddings)
+                    added.extend(c.id for c in fresh)
+                    job.chunks_embedded += len(fresh)
+
+            if not job.chunks_total:
+                raise ValueError("No text could be extracted from this document. Is it a scanned image? Try a text-based PDF.")
+
+            self._check_cancelled(job)
+            removed = list(existing - seen)
+            with timings.span("upsert"):
+                replaced = store.finalize_document(job.doc_id, job.filename, file_hash, removed, len(seen))
+            job.chunks_removed = len(removed)
+            if replaced:
+                self._release_file(job.workspace, store, replaced, job)
+
+            # Pulling chunks also pulls pages: keep "chunk" to chunking alone
+            timings.stages["chunk"] -= timings.stages.get("extract", 0.0)
+            timings.observe()
+            job.timings = {stage: round(seconds, 3) for stage, seconds in timings.stages.items()}
+
+            print(
+                f"Processed {job.filename}: {job.pages_parsed} pages ({job.pages_cached} cached), {job.chunks_embedded} chunks embedded, "
+                f"{job.chunks_unchanged} unchanged, {job.chunks_removed} removed."
+            )
+            self._finish(job, "completed")
+        except Exception as e:
+            cancelled = isinstance(e, JobCancelled) or job.job_id in self._cancelled
+            if added:
+                # Drop what this run added; the previous revision stays searchable
+                try:
+                    store.delete_chunks(job.doc_id, added)
+                except Exception as cleanup_error:
+                    print(f"Cleanup failed for {job.doc_id}: {cleanup_error}")
+            # An upload that produced no document leaves no stored file behind either
+            if file_hash and file_path == workspace_documents(job.workspace).path(file_hash):
+                try:
+                    self._release_file(job.workspace, store, file_hash, job)
+                except Exception as cleanup_error:
+                    print(f"Cleanup failed for {job.filename}: {cleanup_error}")
+            if cancelled:
+                self._finish(job, "cancelled")
+            else:
+                print(f"Ingestion failed for {job.filename}: {e}")
+                self._finish(job, "failed", error=str(e))
+
+    def shutdown(self):
+        self._indexer.shutdown(wait=False, cancel_futures=True)
+        if self._extract_pool is not None:
+            # Waiting for the running ranges lets the workers exit cleanly instead of
+            # erroring on a closed pipe at interpreter exit
+            self._extract_pool.shutdown(wait=True, cancel_futures=True)
+
+job_manager = JobManager()
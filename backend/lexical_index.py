@@ -0,0 +1,144 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from .config import settings
+from .models import Chunk
+
+# Keeps part numbers, error codes and versions whole: "E-1042", "v2.3", "ISO_9001".
+# \w is Unicode-aware, so accented and non-Latin words are terms too
+TOKEN_PATTERN = re.compile(r"\w+(?:[-_.]\w+)*")
+
+# Bump whenever tokenize() changes: an index built with another version is emptied on
+# open, and the vector store rebuilds it
+TOKENIZER_VERSION = 2
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when where which who why will with how do does".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    # NFKC folds compatibility forms (full-width letters, ligatures); casefold() also maps "ß" to "ss"
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return [t for t in TOKEN_PATTERN.findall(text) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    Incrementally maintained inverted index with Okapi BM25 scoring.
+
+    Postings live in SQLite so the index is persistent and updates touch only the
+    chunks that changed; corpus statistics (N, total length) are kept in memory.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, length INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != TOKENIZER_VERSION:
+            if self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]:
+                print(f"BM25 index at {path} was built with another tokenizer; it will be rebuilt.")
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+        self._db.commit()
+        self._load_stats()
+
+    def _load_stats(self):
+        n, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+        self._n = n
+        self._total_length = total
+
+    def count(self) -> int:
+        return self._n
+
+    def _delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            self._db.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            self._db.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", batch)
+
+    def add(self, chunks: List[Chunk]):
+        if not chunks:
+            return
+        with self._lock:
+            self._delete(c.id for c in chunks)
+            chunk_rows, posting_rows = [], []
+            for c in chunks:
+                terms = tokenize(c.text)
+                chunk_rows.append((c.id, c.metadata.doc_id, len(terms)))
+                posting_rows.extend((term, c.id, tf) for term, tf in Counter(terms).items())
+            self._db.executemany("INSERT INTO chunks (chunk_id, doc_id, length) VALUES (?, ?, ?)", chunk_rows)
+            self._db.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._db.commit()
+            self._load_stats()
+
+    def remove(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._delete(ids)
+            self._db.commit()
+            self._load_stats()
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            ids = [row[0] for row in self._db.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))]
+            self._delete(ids)
+            self._db.commit()
+            self._load_stats()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+            self._load_stats()
+
+    def search(self, query: str, top_k: int, doc_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        terms = sorted(set(tokenize(query)))
+        if not terms or not self._n:
+            return []
+
+        k1, b = settings.BM25_K1, settings.BM25_B
+        with self._lock:
+            n, avgdl = self._n, self._total_length / self._n
+            marks = ",".join("?" * len(terms))
+            df = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", terms
+            ))
+            # Corpus statistics stay global; a doc_id scope only filters which chunks are scored
+            sql = (
+                f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                f"WHERE p.term IN ({marks})"
+            )
+            params = list(terms)
+            if doc_ids is not None:
+                sql += f" AND c.doc_id IN ({','.join('?' * len(doc_ids))})"
+                params += list(doc_ids)
+            rows = self._db.execute(sql, params).fetchall()
+
+        idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        scores = defaultdict(float)
+        for term, chunk_id, tf, length in rows:
+            scores[chunk_id] += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+    def close(self):
+        self._db.close()
@@ -1,48 +1,95 @@
-import requests
 import json
+import httpx
+from typing import AsyncIterator, Optional
 from .config import settings
 
 class LLMClient:
     def __init__(self):
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = settings.DEFAULT_LLM_MODEL
+        self._client: Optional[httpx.AsyncClient] = None
 
-    def generate_response(self, prompt: str, system_prompt: str = None) -> str:
-        """
-        Generate a comprehensive response (blocking).
-        """
-        # ... reuse existing logic or call stream and join ...
-        return "".join(self.generate_response_stream(prompt, system_prompt))
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so the pool binds to the server's event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(
+                    settings.OLLAMA_READ_TIMEOUT,
+                    connect=settings.OLLAMA_CONNECT_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS
+                )
+            )
+        return self._client
 
-    def generate_response_stream(self, prompt: str, system_prompt: str = None):
-        """
-        Generator that yields chunks of the response.
-        """
-        url = f"{self.base_url}/api/chat"
-        
+    def _payload(self, prompt: str, system_prompt: str = None, model: str = None) -> dict:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
-        
-        payload = {
-            "model": self.model,
+
+        return {
+            "model": model or self.model,
             "messages": messages,
-            "stream": True
+            "stream": True,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE
         }
-        
+
+    async def preload(self, model: str = None):
+        """
+        Loads the model into Ollama's memory without generating anything.
+        """
+        r = await self._http().post(
+            "/api/generate",
+            json={"model": model or self.model, "keep_alive": settings.OLLAMA_KEEP_ALIVE}
+        )
+        r.raise_for_status()
+
+    async def _stream_chat(self, payload: dict) -> AsyncIterator[str]:
+        # Leaving this context early (e.g. the caller is cancelled because the client
+        # went away) closes the connection, which makes Ollama abort the generation.
+        async with self._http().stream("POST", "/api/chat", json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line:
+                    body = json.loads(line)
+                    if "message" in body and "content" in body["message"]:
+                        yield body["message"]["content"]
+                    if body.get("done", False):
+                        break
+
+    async def generate_response(self, prompt: str, system_prompt: str = None, model: str = None) -> str:
+        """
+        Generate a complete response. Raises on transport errors.
+        """
+        parts = []
+        async for chunk in self._stream_chat(self._payload(prompt, system_prompt, model)):
+            parts.append(chunk)
+        return "".join(parts)
+
+    async def generate_response_stream(self, prompt: str, system_prompt: str = None, model: str = None, raise_errors: bool = False) -> AsyncIterator[str]:
+        """
+        Async generator that yields chunks of the response.
+        Errors are yielded as a final "Error: ..." chunk unless raise_errors is set.
+        """
+        stream = self._stream_chat(self._payload(prompt, system_prompt, model))
         try:
-            with requests.post(url, json=payload, stream=True) as r:
-                r.raise_for_status()
-                for line in r.iter_lines():
-                    if line:
-                        body = json.loads(line)
-                        if "message" in body and "content" in body["message"]:
-                            yield body["message"]["content"]
-                        if body.get("done", False):
-                            break
+            async for chunk in stream:
+                yield chunk
         except Exception as e:
             print(f"LLM Stream Error: {e}")
+            if raise_errors:
+                raise
             yield f"Error: {e}"
+        finally:
+            await stream.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
 llm_client = LLMClient()
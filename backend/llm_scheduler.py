@@ -0,0 +1,209 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Tuple
+
+from .config import settings
+from .metrics import LLM_QUEUE_WAIT_SECONDS
+
+class SchedulerFull(Exception):
+    pass
+
+class QueueTimeout(Exception):
+    pass
+
+class Ticket:
+    """
+    One request's place in a lane: waiting, then holding a slot until released.
+    """
+    def __init__(self, lane: "Lane", user: str):
+        self.lane = lane
+        self.user = user
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.perf_counter()
+        self._changed = asyncio.Event()
+
+    @property
+    def position(self) -> int:
+        # 1 = next to be served, 0 = running
+        return 0 if self.granted else self.lane.position(self)
+
+    async def wait(self, timeout: float) -> AsyncIterator[int]:
+        """
+        Yields the queue position when it changes, and about once a second regardless
+        (so callers can check for a disconnect), until a slot is granted. Gives up
+        after timeout seconds with QueueTimeout.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.granted:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.lane.timeouts += 1
+                self.release()
+                raise QueueTimeout(f"The {self.lane.model} model is busy: no slot within {timeout:.0f}s. Try again shortly.")
+            self._changed.clear()
+            yield self.position
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(1.0, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.lane.release(self)
+
+class Lane:
+    """
+    Slots and wait queue for one kind of call to one model. Waiting tickets are kept
+    per user and served round-robin, so one user's burst can't starve the others.
+    limit <= 0 admits everything at once.
+    """
+    def __init__(self, model: str, kind: str, limit: int, max_queue: int):
+        self.model = model
+        self.kind = kind
+        self.limit = limit
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self._waiting: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+
+        # Metrics
+        self.served = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @property
+    def full(self) -> bool:
+        return self.limit > 0 and self.running >= self.limit and self.queued >= self.max_queue
+
+    def submit(self, user: str) -> Ticket:
+        ticket = Ticket(self, user)
+        if self.limit <= 0 or (self.running < self.limit and not self.queued):
+            self._grant(ticket)
+            return ticket
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerFull(f"Too many requests waiting for {self.model}. Try again shortly.")
+        self._waiting.setdefault(user, deque()).append(ticket)
+        self.queued += 1
+        # A new user joins the rotation and can move others back
+        self._notify()
+        return ticket
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        self.running += 1
+        self.served += 1
+        LLM_QUEUE_WAIT_SECONDS.labels(self.kind).observe(time.perf_counter() - ticket.enqueued_at)
+        ticket._changed.set()
+
+    def release(self, ticket: Ticket):
+        if ticket.granted:
+            self.running -= 1
+            self._dispatch()
+            return
+        tickets = self._waiting.get(ticket.user)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            self.queued -= 1
+            if not tickets:
+                del self._waiting[ticket.user]
+            self._notify()
+
+    def _dispatch(self):
+        while self._waiting and (self.limit <= 0 or self.running < self.limit):
+            user, tickets = next(iter(self._waiting.items()))
+            ticket = tickets.popleft()
+            self.queued -= 1
+            # The user goes to the back of the rotation
+            del self._waiting[user]
+            if tickets:
+                self._waiting[user] = tickets
+            self._grant(ticket)
+        self._notify()
+
+    def _notify(self):
+        for tickets in self._waiting.values():
+            for ticket in tickets:
+                ticket._changed.set()
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        When the rotation reaches this ticket: it is served in round i (its index among
+        its user's tickets), after every earlier round and after the users ahead of it
+        in the rotation that still have a ticket in round i.
+        """
+        tickets = self._waiting.get(ticket.user)
+        if tickets is None or ticket not in tickets:
+            return 0
+        i = tickets.index(ticket)
+        ahead, before = 0, True
+        for user, others in self._waiting.items():
+            before = before and user != ticket.user
+            ahead += min(len(others), i) + (1 if before and len(others) > i else 0)
+        return ahead + 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": self.queued,
+            "users_waiting": len(self._waiting),
+            "served": self.served,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM client.
+
+    Every model has a lane per kind of call, each with its own concurrency limit and
+    bounded wait queue: short query rewrites never wait behind long answer generations.
+    When a queue is full new requests are shed (SchedulerFull) rather than queued, and
+    a request that waits longer than LLM_QUEUE_TIMEOUT gives up (QueueTimeout).
+
+    Slots are per API process; with several workers, divide the limits among them.
+    """
+    ANSWER = "answer"
+    REWRITE = "rewrite"
+
+    def __init__(self):
+        self._lanes: Dict[Tuple[str, str], Lane] = {}
+
+    def lane(self, model: str, kind: str = ANSWER) -> Lane:
+        lane = self._lanes.get((model, kind))
+        if lane is None:
+            if kind == self.REWRITE:
+                limit = settings.LLM_MAX_CONCURRENT_REWRITES
+            else:
+                limit = settings.LLM_MODEL_CONCURRENCY.get(model, settings.LLM_MAX_CONCURRENT)
+            lane = self._lanes[(model, kind)] = Lane(model, kind, limit, settings.LLM_MAX_QUEUE)
+        return lane
+
+    def submit(self, model: str, user: str, kind: str = ANSWER) -> Ticket:
+        return self.lane(model, kind).submit(user)
+
+    def full(self, model: str, kind: str = ANSWER) -> bool:
+        return self.lane(model, kind).full
+
+    @asynccontextmanager
+    async def slot(self, model: str, user: str, kind: str = ANSWER):
+        """
+        Holds a slot for the duration of the block, waiting quietly for it first.
+        """
+        ticket = self.submit(model, user, kind)
+        try:
+            async for _ in ticket.wait(settings.LLM_QUEUE_TIMEOUT):
+                pass
+            yield
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        return {f"{model}/{kind}": lane.stats() for (model, kind), lane in self._lanes.items()}
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,103 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional
+
+from prometheus_client import Histogram
+
+# Spans run from a few ms (cache hits) to minutes (CPU-only generation, large PDFs)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds", "Time spent per query stage",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_tokens_per_second", "Generation speed of streamed answers",
+    buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320)
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds", "Time spent per ingestion stage, per document",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "rag_llm_queue_wait_seconds", "Time LLM calls waited for a generation slot",
+    ["lane"], buckets=STAGE_BUCKETS
+)
+PAGE_EXTRACT_SECONDS = Histogram(
+    "rag_page_extract_seconds", "Text extraction time per page (cache misses only)",
+    buckets=STAGE_BUCKETS
+)
+
+class Timings:
+    """
+    Per-request (or per-document) stage durations, in seconds. Repeated spans of the
+    same stage add up. observe() records the totals into a labelled histogram once.
+    """
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def timed(self, iterable: Iterable, stage: str) -> Iterator:
+        """
+        Wraps an iterator, charging the time spent producing each item to `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def observe(self):
+        for stage, seconds in self.stages.items():
+            self.histogram.labels(stage).observe(seconds)
+
+    def as_ms(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+# The query being served on this task (copied into its threadpool calls and subtasks)
+_current: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+@contextmanager
+def collect(timings: Timings):
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An async generator closed from another task/context; nothing to restore there
+            pass
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a block against the current request, if there is one.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    with timings.span(stage):
+        yield
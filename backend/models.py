@@ -1,11 +1,12 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class DocumentMetadata(BaseModel):
     filename: str
     page: Optional[int] = None
     chunk_index: int
     doc_id: str
+    file_hash: str = ""  # Set on every chunk once the whole document is indexed
 
 class Chunk(BaseModel):
     id: str
@@ -16,8 +17,15 @@ class QueryRequest(BaseModel):
     query: str
     model: Optional[str] = None
     messages: List[dict] = [] # Chat history [{"role": "user", "content": "..."}]
+    doc_ids: Optional[List[str]] = None  # Restrict retrieval to these documents
+    filenames: Optional[List[str]] = None  # ...or to these uploaded files
+    include_timings: bool = False  # End the stream with a {"timings": {...}} event
+    workspace: str = "default"
+    user: Optional[str] = None  # Who the LLM queue is fair between; only honoured from LLM_TRUSTED_USER_HOSTS
 
 class RetrievalResult(BaseModel):
+    chunk_id: Optional[str] = None
+    doc_id: Optional[str] = None
     filename: str
     page: Optional[int]
     chunk_index: int
@@ -29,7 +37,57 @@ class QueryResponse(BaseModel):
     citations: List[RetrievalResult]
     model_used: str
 
+class DocumentInfo(BaseModel):
+    doc_id: str
+    filename: str
+    file_hash: str
+    chunk_count: int
+    ingested_at: float
+
+class WorkspaceInfo(BaseModel):
+    name: str
+    open: bool = False  # Indexes currently loaded in the index service
+    memory_bytes: int = 0  # Estimated, while open
+
+class BulkDocument(BaseModel):
+    filename: str
+    file_hash: str
+    chunks: List[Chunk]
+    embeddings: Dict[str, List[float]] = {}  # chunk id -> vector; only needed for chunks not stored yet
+
+class BulkIngestRequest(BaseModel):
+    model: str  # Embedding model the vectors came from; must match the server's
+    documents: List[BulkDocument]
+    workspace: str = "default"
+
+class BulkIngestResponse(BaseModel):
+    documents: int = 0
+    chunks_embedded: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+
 class UploadResponse(BaseModel):
     message: str
-    doc_id: str
-    chunks_created: int
+    job_id: str
+    status: str
+    file_hash: Optional[str] = None
+    duplicate_of: List[str] = []  # Indexed documents with the same content
+
+class IngestionJob(BaseModel):
+    job_id: str
+    filename: str
+    workspace: str = "default"
+    status: str = "queued"  # queued | extracting | indexing | completed | unchanged | failed | cancelled
+    doc_id: Optional[str] = None
+    pages_total: Optional[int] = None
+    pages_parsed: int = 0
+    pages_cached: int = 0  # Pages served from the extracted-text cache
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+    timings: Dict[str, float] = {}  # Seconds per stage: extract, chunk, embed, upsert
+    slowest_pages: List[dict] = []  # [{"page", "seconds"}], slowest extractions first
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
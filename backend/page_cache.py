@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class PageTextCache:
+    """
+    Extracted page text keyed by file hash and page number, so a file is parsed once no
+    matter how often it is re-chunked or re-embedded.
+
+    Text is stored as extracted (before cleaning): cleaning depends on the chunking
+    strategy and is cheap next to pypdf's extract_text(). The extraction time of each
+    page is kept alongside, for spotting pathological pages.
+
+    Holds at most capacity pages; past that, the least recently used files are dropped
+    whole.
+    """
+    EVICT_FRACTION = 0.05
+
+    def __init__(self, path: str, capacity: int):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (file_hash TEXT PRIMARY KEY, page_count INTEGER NOT NULL, "
+            "last_used REAL NOT NULL DEFAULT 0)"
+        )
+        # Caches written before eviction existed have no last_used column
+        if "last_used" not in {row[1] for row in self._db.execute("PRAGMA table_info(files)")}:
+            self._db.execute("ALTER TABLE files ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages (file_hash TEXT NOT NULL, page INTEGER NOT NULL, "
+            "text TEXT NOT NULL, seconds REAL NOT NULL, PRIMARY KEY (file_hash, page))"
+        )
+        self._db.commit()
+        self._pages = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def _touch(self, file_hash: str):
+        self._db.execute("UPDATE files SET last_used = ? WHERE file_hash = ?", (time.time(), file_hash))
+
+    def page_count(self, file_hash: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute("SELECT page_count FROM files WHERE file_hash = ?", (file_hash,)).fetchone()
+            if row:
+                self._touch(file_hash)
+                self._db.commit()
+        return row[0] if row else None
+
+    def set_page_count(self, file_hash: str, page_count: int):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (file_hash, page_count, last_used) VALUES (?, ?, ?)",
+                (file_hash, page_count, time.time())
+            )
+            self._db.commit()
+
+    def get(self, file_hash: str, first_page: int, last_page: int) -> Dict[int, str]:
+        """
+        Cached text for 1-based page numbers in [first_page, last_page].
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, text FROM pages WHERE file_hash = ? AND page BETWEEN ? AND ?",
+                (file_hash, first_page, last_page)
+            ).fetchall()
+            found = dict(rows)
+            self.hits += len(found)
+            self.misses += last_page - first_page + 1 - len(found)
+        return found
+
+    def put(self, file_hash: str, pages: Iterable[Tuple[int, str, float]]):
+        """
+        Stores (page, text, seconds) rows.
+        """
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pages (file_hash, page, text, seconds) VALUES (?, ?, ?, ?)",
+                [(file_hash, page, text, seconds) for page, text, seconds in pages]
+            )
+            self._pages += self._db.total_changes - before
+            self._touch(file_hash)
+            if self._pages > self.capacity:
+                self._evict(file_hash)
+            self._db.commit()
+
+    def _evict(self, keep: str):
+        # Down to a little under capacity, so the next few puts don't evict again
+        target = self.capacity - int(self.capacity * self.EVICT_FRACTION)
+        victims = []
+        for victim, count in self._db.execute(
+            "SELECT f.file_hash, COUNT(p.page) FROM files f LEFT JOIN pages p ON p.file_hash = f.file_hash "
+            "WHERE f.file_hash != ? GROUP BY f.file_hash ORDER BY f.last_used", (keep,)
+        ).fetchall():
+            if self._pages <= target:
+                break
+            victims.append(victim)
+            self._pages -= count
+        self._delete(victims)
+        self.evictions += len(victims)
+
+    def _delete(self, file_hashes: List[str]):
+        for table in ("pages", "files"):
+            self._db.executemany(f"DELETE FROM {table} WHERE file_hash = ?", [(h,) for h in file_hashes])
+
+    def remove(self, file_hashes: Iterable[str]):
+        """
+        Drops the text of these files, e.g. once no document uses them any more.
+        """
+        with self._lock:
+            self._delete(list(file_hashes))
+            self._db.commit()
+            self._pages = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def slowest(self, file_hash: str, limit: int = 5) -> List[Tuple[int, float]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT page, seconds FROM pages WHERE file_hash = ? ORDER BY seconds DESC LIMIT ?",
+                (file_hash, limit)
+            ).fetchall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, pages = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM files), (SELECT COUNT(*) FROM pages)"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "files": files,
+            "pages": pages,
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+from typing import Callable, Optional
+
+from .config import settings
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval while a request runs.
+
+    Wall-clock sampling of all threads (not cProfile) so work handed to the threadpool,
+    the batchers and the indexer shows up too. Other requests running at the same time
+    do as well; the thread name is the root frame to tell them apart. Output is the
+    folded-stack format read by flamegraph.pl and speedscope.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._then: Optional[Callable[[], None]] = None
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+        if self._then is not None:
+            self._then()
+
+    def stop(self, then: Optional[Callable[[], None]] = None):
+        """
+        Returns at once; the sampler thread finishes its current sample, then runs then().
+        """
+        self._then = then
+        self._stop.set()
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+def maybe_start() -> Optional[SamplingProfiler]:
+    # Only a sample of requests pays for profiling; whether it was slow is known at the end
+    if not settings.PROFILE_SLOW_REQUESTS or random.random() >= settings.PROFILE_SAMPLE_RATE:
+        return None
+    return SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000).start()
+
+def finish(profiler: Optional[SamplingProfiler], seconds: float, label: str):
+    """
+    Stops the profiler and, for a slow request, writes its profile. Called from the event
+    loop, so the wait for the sampler and the file write both happen on the sampler thread.
+    """
+    if profiler is None:
+        return
+
+    def write():
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{int(seconds * 1000)}ms.folded")
+        profiler.dump(path)
+        print(f"Slow {label} ({seconds:.1f}s), profile written to {path}")
+
+    profiler.stop(then=write if seconds >= settings.SLOW_REQUEST_SECONDS else None)
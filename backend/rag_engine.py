@@ -1,93 +1,274 @@
+import re
 import json
-from typing import List
+import time
+import numpy as np
+from typing import Awaitable, Callable, List, Optional
 from starlette.concurrency import run_in_threadpool
 import asyncio
 
-from .vector_store import vector_store
-from .embeddings import embedding_model
+from .index_service import index
+from .workspaces import DEFAULT_WORKSPACE
 from .llm import llm_client
+from .llm_scheduler import llm_scheduler, SchedulerFull, QueueTimeout
 from .models import QueryResponse, RetrievalResult
 from .config import settings
+from .cache import LRUCache
+from .answer_cache import AnswerCache, CachedAnswer
+from .context import context_assembler
+from .batching import embedding_batcher, rerank_batcher
+from .metrics import Timings, QUERY_STAGE_SECONDS, LLM_TOKENS_PER_SECOND, collect, span
+from . import profiling
 
-from sentence_transformers import CrossEncoder
+# Markers of a follow-up that can't be searched without the conversation
+_FOLLOW_UP_PREFIX = re.compile(r"^(and|but|or|also|so|then|what about|how about)\b")
+_ANAPHORA = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|his|"
+    r"above|previous|former|latter|same|else|again|more)\b"
+)
 
-# Lazy load global variable
-_reranker = None
+# Cached answers are replayed a few words at a time, like a live stream
+_REPLAY_PIECE = re.compile(r"\s*(?:\S+\s*){1,8}")
+
+def _reciprocal_rank_fusion(rankings: List[List[RetrievalResult]], limit: int) -> List[RetrievalResult]:
+    # score(d) = sum over rankings of 1 / (k + rank); robust to the two scorers' different scales
+    fused, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc.chunk_id] = fused.get(doc.chunk_id, 0.0) + 1.0 / (settings.RRF_K + rank + 1)
+            docs.setdefault(doc.chunk_id, doc)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:limit]
+    for chunk_id in ordered:
+        docs[chunk_id].score = fused[chunk_id]
+    return [docs[chunk_id] for chunk_id in ordered]
+
+def _merge_candidates(primary: List[RetrievalResult], secondary: List[RetrievalResult], limit: int) -> List[RetrievalResult]:
+    # Interleave both rankings, dropping duplicates, so neither list crowds the other out
+    merged, seen = [], set()
+    for i in range(max(len(primary), len(secondary))):
+        for docs in (primary, secondary):
+            if i < len(docs) and docs[i].chunk_id not in seen:
+                seen.add(docs[i].chunk_id)
+                merged.append(docs[i])
+    return merged[:limit]
 
 class RAGEngine:
-    async def query_stream(self, user_query: str, history: List[dict] = []):
+    def __init__(self):
+        # Pre-generation memoization: identical questions skip rewrite, embed and rerank work
+        self._rewrite_cache = LRUCache(settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL)
+        self._embedding_cache = LRUCache(settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL)
+        self._rerank_cache = LRUCache(settings.QUERY_CACHE_SIZE * 16, ttl=settings.QUERY_CACHE_TTL)
+        self._answer_cache = AnswerCache(
+            settings.ANSWER_CACHE_SIZE,
+            threshold=settings.ANSWER_CACHE_THRESHOLD,
+            ttl=settings.ANSWER_CACHE_TTL
+        )
+        # Writes can happen in another process (the index service): catch up before each query
+        self._index_version = (None, 0)
+
+    def _sync_changes(self):
+        instance, generation, doc_ids = index.changes_since(*self._index_version)
+        if doc_ids is None or doc_ids:
+            self._invalidate(doc_ids)
+        self._index_version = (instance, generation)
+
+    def _invalidate(self, doc_ids=None):
+        self._rewrite_cache.clear()
+        self._embedding_cache.clear()
+        self._rerank_cache.clear()
+        self._answer_cache.invalidate(doc_ids)
+
+    def cache_stats(self) -> dict:
+        return {
+            "rewrite": self._rewrite_cache.stats(),
+            "query_embedding": self._embedding_cache.stats(),
+            "rerank": self._rerank_cache.stats(),
+            "answer": self._answer_cache.stats(),
+        }
+
+    def _needs_rewrite(self, user_query: str, history: List[dict]) -> bool:
+        """
+        Cheap check for follow-ups that lean on the conversation ("what about it?").
+        Self-contained questions go straight to retrieval.
+        """
+        if not history:
+            return False
+        if not settings.SKIP_SELF_CONTAINED_REWRITE:
+            return True
+        query = user_query.strip().lower()
+        if len(query.split()) <= 3:
+            return True
+        if _FOLLOW_UP_PREFIX.match(query):
+            return True
+        return bool(_ANAPHORA.search(query))
+
+    async def _rewrite(self, user_query: str, history: List[dict], model: Optional[str], user: str = "anonymous") -> str:
+        rewrite_key = (model, tuple((m['role'], m['content']) for m in history[-4:]), user_query)
+        cached_rewrite = self._rewrite_cache.get(rewrite_key)
+        if cached_rewrite is not None:
+            return cached_rewrite
+
+        try:
+            history_str = ""
+            for msg in history[-4:]:
+                history_str += f"{msg['role']}: {msg['content']}\n"
+            
+            rewrite_prompt = (
+                f"Given the following conversation history and a follow-up question, "
+                f"rewrite the follow-up question to be a standalone question that captures all context. "
+                f"Do NOT answer the question, just rewrite it.\n\n"
+                f"Chat History:\n{history_str}\n"
+                f"Follow-up Question: {user_query}\n\n"
+                f"Standalone Question:"
+            )
+            
+            with span("rewrite"):
+                async with llm_scheduler.slot(model or llm_client.model, user, llm_scheduler.REWRITE):
+                    standalone_query = (await llm_client.generate_response(rewrite_prompt, model=model)).strip()
+            if not standalone_query:
+                return user_query
+            self._rewrite_cache.put(rewrite_key, standalone_query)
+            return standalone_query
+        except Exception as e:
+            print(f"Rewrite error: {e}")
+            return user_query
+
+    async def _embed(self, query: str) -> List[float]:
+        emb = self._embedding_cache.get(query)
+        if emb is None:
+            # Batched with any other queries arriving in the same few milliseconds
+            with span("embed"):
+                emb = (await embedding_batcher.submit([query]))[0]
+            self._embedding_cache.put(query, emb)
+        return emb
+
+    async def _search(self, query: str, top_k: int, emb: Optional[List[float]] = None, doc_ids: Optional[List[str]] = None, workspace: str = DEFAULT_WORKSPACE):
+        if emb is None:
+            emb = await self._embed(query)
+        # Retrieve (Blocking)
+        def run_query():
+            scope = doc_ids
+            if scope is None and settings.DOC_ROUTING and index.document_count(workspace) >= settings.ROUTING_MIN_DOCS:
+                scope = index.route(emb, settings.ROUTING_TOP_DOCS, workspace)
+            where = {"doc_id": {"$in": scope}} if scope is not None else None
+            return index.query(emb, top_k, where, workspace)
+
+        if not settings.HYBRID_SEARCH:
+            with span("retrieve"):
+                return emb, await run_in_threadpool(run_query)
+
+        # Dense and BM25 run side by side, then get fused by rank. BM25 stays corpus-wide,
+        # so exact keyword hits survive a routing miss.
+        def run_lexical():
+            return index.lexical_query(query, top_k, doc_ids, workspace)
+        with span("retrieve"):
+            dense, lexical = await asyncio.gather(run_in_threadpool(run_query), run_in_threadpool(run_lexical))
+        return emb, _reciprocal_rank_fusion([dense, lexical], top_k)
+
+    async def _speculative_search(self, user_query: str, history: List[dict], model: Optional[str], top_k: int, doc_ids: Optional[List[str]] = None, workspace: str = DEFAULT_WORKSPACE, user: str = "anonymous"):
+        """
+        Retrieves for the raw follow-up while the rewrite is still running. If the rewrite
+        lands close to the raw query the speculative candidates are used as-is, otherwise
+        a second retrieval runs and both candidate lists are merged.
+        """
+        rewrite_task = asyncio.create_task(self._rewrite(user_query, history, model, user))
+        try:
+            raw_emb, raw_docs = await self._search(user_query, top_k, doc_ids=doc_ids, workspace=workspace)
+            standalone_query = await rewrite_task
+        finally:
+            rewrite_task.cancel()
+
+        if standalone_query == user_query:
+            return standalone_query, raw_docs
+
+        emb = await self._embed(standalone_query)
+        similarity = float(np.dot(raw_emb, emb) / (np.linalg.norm(raw_emb) * np.linalg.norm(emb) or 1.0))
+        if similarity >= settings.REWRITE_REUSE_THRESHOLD:
+            return standalone_query, raw_docs
+
+        _, docs = await self._search(standalone_query, top_k, emb, doc_ids=doc_ids, workspace=workspace)
+        return standalone_query, _merge_candidates(docs, raw_docs, top_k)
+
+    async def query_stream(self, user_query: str, history: List[dict] = [], model: Optional[str] = None, doc_ids: Optional[List[str]] = None, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None, include_timings: bool = False, workspace: str = DEFAULT_WORKSPACE, user: str = "anonymous"):
         """
         Async Generator for RAG response.
+        Retrieves from the given workspace; doc_ids, if given, restricts retrieval to those documents.
+        LLM calls queue fairly per user (see LLMScheduler); the wait is reported in status events.
+        Stops (and drops the upstream Ollama request) once is_disconnected() reports the client gone.
+        Stage timings go to /metrics and, with include_timings, a final {"timings": ...} event.
         """
+        timings = Timings(QUERY_STAGE_SECONDS)
+        profiler = profiling.maybe_start()
+        answer = self._answer(user_query, history, model, doc_ids, workspace, user, is_disconnected, timings)
+        try:
+            with collect(timings):
+                async for line in answer:
+                    yield line
+            timings.add("total", timings.elapsed())
+            if include_timings:
+                yield json.dumps({"timings": timings.as_ms()}) + "\n"
+        finally:
+            # Closing the inner generator right away is what drops the upstream LLM request
+            await answer.aclose()
+            timings.observe()
+            profiling.finish(profiler, timings.elapsed(), "query")
+
+    async def _answer(self, user_query: str, history: List[dict], model: Optional[str], doc_ids: Optional[List[str]], workspace: str, user: str, is_disconnected, timings: Timings):
         print("DEBUG: Entered Async query_stream")
         yield json.dumps({"status": "DEBUG: Stream Connection Established"}) + "\n"
         
         # Yield start status
         yield json.dumps({"status": "🧠 Contextualizing query..."}) + "\n"
 
-        # 0. Contextualize
-        standalone_query = user_query
-        if history:
-            try:
-                history_str = ""
-                for msg in history[-4:]:
-                    history_str += f"{msg['role']}: {msg['content']}\n"
-                
-                rewrite_prompt = (
-                    f"Given the following conversation history and a follow-up question, "
-                    f"rewrite the follow-up question to be a standalone question that captures all context. "
-                    f"Do NOT answer the question, just rewrite it.\n\n"
-                    f"Chat History:\n{history_str}\n"
-                    f"Follow-up Question: {user_query}\n\n"
-                    f"Standalone Question:"
-                )
-                
-                # Wrapper for LLM call
-                def run_rewrite():
-                    return llm_client.generate_response(rewrite_prompt).strip()
-                
-                standalone_query = await run_in_threadpool(run_rewrite)
-            except Exception as e:
-                print(f"Rewrite error: {e}")
-
-        # 1. Embed & Retrieve
-        yield json.dumps({"status": "🔍 Searching documents..."}) + "\n"
-        
         # Determine K and Initial K
         target_k = settings.TOP_K_RETRIEVAL
-        initial_k = target_k * 3
-        
-        # Embed (Blocking)
-        def run_embed():
-            return embedding_model.generate([standalone_query])[0]
-        emb = await run_in_threadpool(run_embed)
-        
-        # Retrieve (Blocking)
-        def run_query():
-            return vector_store.query(emb, top_k=initial_k)
-        candidate_docs = await run_in_threadpool(run_query)
+        initial_k = max(settings.RETRIEVAL_CANDIDATES, target_k)
+
+        cacheable = settings.ANSWER_CACHE_ENABLED and not history
+        await run_in_threadpool(self._sync_changes)
+        answer_scope = (workspace, model or llm_client.model, tuple(sorted(doc_ids)) if doc_ids is not None else None)
+
+        # 0. Contextualize & 1. Embed & Retrieve
+        if not self._needs_rewrite(user_query, history):
+            standalone_query = user_query
+            emb = await self._embed(standalone_query)
+
+            # Fresh questions (no history in the prompt) can be answered from the semantic cache
+            if cacheable:
+                cached = self._answer_cache.lookup(emb, answer_scope)
+                if cached is not None:
+                    async for line in self._replay(cached):
+                        yield line
+                    return
+
+            yield json.dumps({"status": "🔍 Searching documents..."}) + "\n"
+            _, candidate_docs = await self._search(standalone_query, initial_k, emb, doc_ids=doc_ids, workspace=workspace)
+        elif settings.SPECULATIVE_RETRIEVAL:
+            yield json.dumps({"status": "🔍 Searching documents..."}) + "\n"
+            standalone_query, candidate_docs = await self._speculative_search(user_query, history, model, initial_k, doc_ids=doc_ids, workspace=workspace, user=user)
+        else:
+            standalone_query = await self._rewrite(user_query, history, model, user)
+            yield json.dumps({"status": "🔍 Searching documents..."}) + "\n"
+            _, candidate_docs = await self._search(standalone_query, initial_k, doc_ids=doc_ids, workspace=workspace)
         
         # 2. Rerank (Try/Except)
         retrieved_docs = candidate_docs
         try:
             yield json.dumps({"status": "⚖️ Reranking results..."}) + "\n"
             
-            # Load Reranker (Blocking)
-            global _reranker
-            if _reranker is None:
-                def load_model():
-                    global _reranker
-                    print("Loading CrossEncoder...")
-                    _reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-                    return _reranker
-                await run_in_threadpool(load_model)
-                
+            # Fused candidates beyond the rerank depth are dropped, not scored
+            candidate_docs = candidate_docs[:max(settings.RERANK_DEPTH, target_k)]
             if candidate_docs:
-                def run_predict(query, docs):
-                    pairs = [[query, doc.excerpt] for doc in docs]
-                    return _reranker.predict(pairs)
-                
-                scores = await run_in_threadpool(run_predict, standalone_query, candidate_docs)
+                # Only score the (query, chunk) pairs we haven't seen recently
+                scores = [self._rerank_cache.get((standalone_query, doc.chunk_id)) for doc in candidate_docs]
+                missing = [i for i, score in enumerate(scores) if score is None]
+
+                if missing:
+                    pairs = [[standalone_query, candidate_docs[i].excerpt] for i in missing]
+                    with span("rerank"):
+                        fresh = await rerank_batcher.submit(pairs)
+                    for i, score in zip(missing, fresh):
+                        scores[i] = float(score)
+                        self._rerank_cache.put((standalone_query, candidate_docs[i].chunk_id), scores[i])
                 
                 for i, doc in enumerate(candidate_docs):
                     doc.score = float(scores[i])
@@ -97,14 +278,14 @@ class RAGEngine:
             print(f"Reranking failed (fallback to vector search): {e}")
             retrieved_docs = candidate_docs[:target_k]
 
-        # Yield Citations
-        yield json.dumps({"citations": [d.model_dump() for d in retrieved_docs]}) + "\n"
-        yield json.dumps({"status": "✨ Generating answer..."}) + "\n"
-
         # 3. Context
-        context_block = ""
-        for doc in retrieved_docs:
-            context_block += f"-- Source: {doc.filename} (Page {doc.page})\n{doc.excerpt}\n\n"
+        with span("context"):
+            context_block, used_docs = context_assembler.build(retrieved_docs)
+        used_ids = {d.chunk_id for d in used_docs}
+
+        # Yield Citations (only what actually went into the prompt)
+        citations = [d for d in retrieved_docs if d.chunk_id in used_ids]
+        yield json.dumps({"citations": [d.model_dump() for d in citations]}) + "\n"
         
         if not context_block.strip():
             context_block = "No relevant context found."
@@ -129,11 +310,82 @@ User Question: {user_query}
 
 Answer:"""
 
-        # 5. Stream
-        # Iterate sync generator, yielding control to keep event loop alive
-        for chunk in llm_client.generate_response_stream(full_prompt, system_prompt=system_prompt):
-            yield json.dumps({"chunk": chunk}) + "\n"
-            await asyncio.sleep(0)
+        # 5. Wait for a generation slot, telling the user where they are in the queue
+        try:
+            ticket = llm_scheduler.submit(model or llm_client.model, user)
+        except SchedulerFull as e:
+            yield json.dumps({"chunk": f"Error: {e}"}) + "\n"
+            return
+        try:
+            shown = None
+            with span("queue"):
+                async for position in ticket.wait(settings.LLM_QUEUE_TIMEOUT):
+                    if is_disconnected is not None and await is_disconnected():
+                        print("Client disconnected while queued")
+                        ticket.release()
+                        return
+                    if position != shown:
+                        shown = position
+                        yield json.dumps({"status": f"⏳ Waiting for the model: #{position} in queue", "queue_position": position}) + "\n"
+        except QueueTimeout as e:
+            yield json.dumps({"chunk": f"Error: {e}"}) + "\n"
+            return
+        except BaseException:
+            # Closed or cancelled while queued (the slot may have just been granted)
+            ticket.release()
+            raise
+
+        # 6. Stream
+        # Native async iteration: the event loop stays free between tokens
+        stream = llm_client.generate_response_stream(full_prompt, system_prompt=system_prompt, model=model, raise_errors=True)
+        answer_parts = []
+        completed = False
+        sent = time.perf_counter()
+        first_token = None
+        try:
+            yield json.dumps({"status": "✨ Generating answer..."}) + "\n"
+            async for chunk in stream:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    timings.add("ttft", first_token - sent)
+                if is_disconnected is not None and await is_disconnected():
+                    print("Client disconnected, aborting generation")
+                    break
+                answer_parts.append(chunk)
+                yield json.dumps({"chunk": chunk}) + "\n"
+            else:
+                completed = True
+        except Exception as e:
+            yield json.dumps({"chunk": f"Error: {e}"}) + "\n"
+        finally:
+            await stream.aclose()
+            ticket.release()
+
+        if first_token is not None:
+            # Ollama streams one token per message, so messages approximate tokens
+            generation = time.perf_counter() - first_token
+            timings.add("generate", generation)
+            if len(answer_parts) > 1 and generation > 0:
+                LLM_TOKENS_PER_SECOND.observe((len(answer_parts) - 1) / generation)
+
+        if cacheable and completed and answer_parts:
+            self._answer_cache.store(
+                standalone_query,
+                emb,
+                answer_scope,
+                [d.model_dump() for d in citations],
+                "".join(answer_parts)
+            )
+
+    async def _replay(self, cached: CachedAnswer):
+        """
+        Re-emits a cached answer as the same NDJSON event stream a live answer produces.
+        """
+        yield json.dumps({"status": "⚡ Answer from cache"}) + "\n"
+        yield json.dumps({"citations": cached.citations}) + "\n"
+        yield json.dumps({"status": "✨ Generating answer..."}) + "\n"
+        for piece in _REPLAY_PIECE.findall(cached.answer):
+            yield json.dumps({"chunk": piece}) + "\n"
 
 
 rag_engine = RAGEngine()
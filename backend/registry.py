@@ -0,0 +1,75 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import List, Optional
+
+from .models import DocumentInfo
+
+class DocumentRegistry:
+    """
+    One row per indexed document: doc_id -> filename, file hash, chunk count, ingest time.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, filename TEXT NOT NULL, "
+            "file_hash TEXT NOT NULL, chunk_count INTEGER NOT NULL, ingested_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash)")
+        self._db.commit()
+
+    def upsert(self, doc_id: str, filename: str, file_hash: str, chunk_count: int, ingested_at: Optional[float] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, filename, file_hash, chunk_count, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, filename, file_hash, chunk_count, ingested_at or time.time())
+            )
+            self._db.commit()
+
+    def get(self, doc_id: str) -> Optional[DocumentInfo]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT doc_id, filename, file_hash, chunk_count, ingested_at FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return self._to_info(row) if row else None
+
+    def list(self) -> List[DocumentInfo]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT doc_id, filename, file_hash, chunk_count, ingested_at FROM documents ORDER BY filename"
+            ).fetchall()
+        return [self._to_info(row) for row in rows]
+
+    def find_by_hash(self, file_hash: str) -> List[DocumentInfo]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT doc_id, filename, file_hash, chunk_count, ingested_at FROM documents WHERE file_hash = ?", (file_hash,)
+            ).fetchall()
+        return [self._to_info(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._db.commit()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM documents")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _to_info(row) -> DocumentInfo:
+        doc_id, filename, file_hash, chunk_count, ingested_at = row
+        return DocumentInfo(doc_id=doc_id, filename=filename, file_hash=file_hash, chunk_count=chunk_count, ingested_at=ingested_at)
@@ -0,0 +1,34 @@
+import threading
+from typing import List
+from .config import settings
+
+class Reranker:
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        # Loaded at warm-up or on first use, whichever comes first
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    print(f"Loading CrossEncoder: {settings.RERANKER_MODEL}")
+                    self._model = CrossEncoder(settings.RERANKER_MODEL)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def warmup(self):
+        self.model.predict([["warm-up", "warm-up"]])
+
+    def predict(self, pairs: List[List[str]]) -> List[float]:
+        if not pairs:
+            return []
+        return self.model.predict(pairs).tolist()
+
+# Singleton
+reranker = Reranker()
@@ -1,17 +1,26 @@
 import os
-import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 
 from .config import settings
-from .models import QueryRequest, QueryResponse, UploadResponse, Chunk
-from .ingestion import ingestion_service
-from .vector_store import vector_store
-from .embeddings import embedding_model
+from .models import QueryRequest, QueryResponse, UploadResponse, Chunk, IngestionJob, DocumentInfo, BulkIngestRequest, BulkIngestResponse, WorkspaceInfo
+from .ingestion import document_id, SUPPORTED_EXTENSIONS
+from .index_service import index
 from .rag_engine import rag_engine
+from .llm import llm_client
+from .llm_scheduler import llm_scheduler
+from .batching import embedding_batcher, rerank_batcher
+from .warmup import readiness
+from .writer_lock import WriterLock
+from .uploads import workspace_documents, UploadTooLarge, UnsupportedFileType
+from .workspaces import DEFAULT_WORKSPACE, validate_workspace
 
 app = FastAPI(title="3D RAG Chat API")
+writer_lock = WriterLock(settings.WRITER_LOCK_PATH)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +34,65 @@ app.add_middleware(
 def ping():
     return {"status": "ok", "service": "3D RAG Backend"}
 
+@app.get("/api/live")
+def live():
+    # The process is up and serving; models may still be loading
+    return {"status": "ok"}
+
+@app.get("/api/ready")
+def ready():
+    body = {"ready": readiness.ready, "components": readiness.components}
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.on_event("startup")
+async def startup():
+    # One writer per data directory: a second server (or a bulk ingest run) would corrupt the store.
+    # With a shared index service, the service is the writer and holds the lock.
+    if not settings.INDEX_SERVICE_ADDRESS and not writer_lock.acquire("server"):
+        raise RuntimeError(
+            f"{settings.DATA_DIR} is already being written by {writer_lock.holder()}. "
+            "Stop that process or point DATA_DIR elsewhere."
+        )
+    readiness.start()
+
+@app.get("/api/stats")
+def stats():
+    return {
+        **index.stats(),
+        "query_caches": rag_engine.cache_stats(),
+        "batching": {
+            "embed": embedding_batcher.stats(),
+            "rerank": rerank_batcher.stats(),
+        },
+        "llm_scheduler": llm_scheduler.stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    # Per-stage query/ingestion latency histograms, in the Prometheus text format
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several processes (workers + index service): aggregate what each one wrote
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+async def resolve_workspace(workspace: str, create: bool = False) -> str:
+    # Uploads create a workspace on first use; everything else needs it to exist
+    try:
+        validate_workspace(workspace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not create and not await run_in_threadpool(index.has_workspace, workspace):
+        raise HTTPException(status_code=404, detail=f"Unknown workspace: {workspace}")
+    return workspace
+
+@app.get("/api/workspaces", response_model=List[WorkspaceInfo])
+def list_workspaces():
+    return index.list_workspaces()
+
 @app.post("/api/stream-test")
 async def stream_test(req: QueryRequest):
     async def iterfile():
@@ -34,56 +102,162 @@ async def stream_test(req: QueryRequest):
         yield "chunk 2\n"
     return StreamingResponse(iterfile(), media_type="text/plain")
 
-@app.post("/api/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    file_location = os.path.join(settings.DOCS_DIR, file.filename)
-    
-    # Save File
+# The body is parsed by hand (see DocumentStore.receive), so describe the form for the docs
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+@app.post("/api/upload", response_model=UploadResponse, status_code=202, openapi_extra=UPLOAD_FORM)
+async def upload_document(request: Request, workspace: str = DEFAULT_WORKSPACE):
+    await resolve_workspace(workspace, create=True)
+    # Streamed to content-addressed storage and hashed on the way in
     try:
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
+        stored = await workspace_documents(workspace).receive(
+            request, settings.MAX_UPLOAD_MB * 1024 * 1024, extensions=SUPPORTED_EXTENSIONS
+        )
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {settings.MAX_UPLOAD_MB} MB upload limit")
+    except UnsupportedFileType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
-    
-    # Process
+
+    duplicates = []
+    if await run_in_threadpool(index.has_workspace, workspace):
+        duplicates = await run_in_threadpool(index.find_by_hash, stored.file_hash, workspace)
+
+    # Process in the background; clients poll /api/jobs/{job_id}
+    job = await run_in_threadpool(index.submit_job, stored.path, stored.filename, stored.file_hash, workspace)
+    return UploadResponse(
+        message="Ingestion started",
+        job_id=job.job_id,
+        status=job.status,
+        file_hash=stored.file_hash,
+        duplicate_of=[d.filename for d in duplicates if d.filename != stored.filename]
+    )
+
+@app.get("/api/jobs", response_model=List[IngestionJob])
+def list_jobs(workspace: Optional[str] = None):
+    return index.list_jobs(workspace)
+
+@app.get("/api/jobs/{job_id}", response_model=IngestionJob)
+def get_job(job_id: str):
+    job = index.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/api/jobs/{job_id}", response_model=IngestionJob)
+def cancel_job(job_id: str):
+    if not index.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return index.get_job(job_id)
+
+@app.get("/api/documents", response_model=List[DocumentInfo])
+async def list_documents(workspace: str = DEFAULT_WORKSPACE):
+    await resolve_workspace(workspace)
+    return await run_in_threadpool(index.list_documents, workspace)
+
+@app.delete("/api/documents/{doc_id}", response_model=DocumentInfo)
+async def delete_document(doc_id: str, workspace: str = DEFAULT_WORKSPACE):
+    await resolve_workspace(workspace)
+    info = await run_in_threadpool(index.get_document, doc_id, workspace)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Only this document's chunks go; nothing else is re-embedded. The stored file and
+    # its cached text go too, unless another document has the same content
+    await run_in_threadpool(index.delete_document, doc_id, workspace)
+    legacy_location = os.path.join(settings.DOCS_DIR, info.filename)
+    if workspace == DEFAULT_WORKSPACE and os.path.isfile(legacy_location):
+        os.remove(legacy_location)
+    return info
+
+@app.get("/api/documents/{doc_id}/chunk_ids", response_model=List[str])
+async def document_chunk_ids(doc_id: str, workspace: str = DEFAULT_WORKSPACE):
+    """
+    Ids of the chunks stored for a document (empty if it isn't indexed), so bulk ingestion
+    can skip embedding the ones the server already has.
+    """
+    await resolve_workspace(workspace)
+    return await run_in_threadpool(index.document_chunk_ids, doc_id, workspace)
+
+@app.post("/api/chunks", response_model=BulkIngestResponse)
+async def ingest_chunks(req: BulkIngestRequest):
+    """
+    Already chunked and embedded documents from `python -m backend.bulk_ingest`, which
+    posts here instead of opening the store itself while this server holds it.
+    """
+    if req.model != settings.EMBEDDING_MODEL:
+        raise HTTPException(status_code=409, detail=f"Embeddings must come from {settings.EMBEDDING_MODEL}, got {req.model}")
+    await resolve_workspace(req.workspace, create=True)
     try:
-        chunks = ingestion_service.process_document(file_location, file.filename)
-        
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No text could be extracted from this document. Is it a scanned image? Try a text-based PDF.")
-            
-        # Embed
-        texts = [c.text for c in chunks]
-        embeddings = embedding_model.generate(texts)
-        
-        # Upsert
-        vector_store.upsert_chunks(chunks, embeddings)
-        
-        return UploadResponse(
-            message="Ingestion successful",
-            doc_id=chunks[0].metadata.doc_id,
-            chunks_created=len(chunks)
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+        return await run_in_threadpool(index.write_documents, req.documents, req.workspace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.on_event("shutdown")
+async def shutdown():
+    index.shutdown()
+    await llm_client.aclose()
+    writer_lock.release()
+
 @app.delete("/api/reset")
-async def reset_knowledge_base():
+async def reset_knowledge_base(workspace: str = DEFAULT_WORKSPACE):
+    await resolve_workspace(workspace)
     try:
-        vector_store.reset()
+        await run_in_threadpool(index.reset, workspace)
         # Clean docs folder
-        for f in os.listdir(settings.DOCS_DIR):
-            if f != '.gitkeep':
-                os.remove(os.path.join(settings.DOCS_DIR, f))
-        return {"status": "success", "message": "Knowledge base reset."}
+        workspace_documents(workspace).reset()
+        if workspace == DEFAULT_WORKSPACE:
+            for f in os.listdir(settings.DOCS_DIR):
+                if f != '.gitkeep' and os.path.isfile(os.path.join(settings.DOCS_DIR, f)):
+                    os.remove(os.path.join(settings.DOCS_DIR, f))
+        return {"status": "success", "message": f"Knowledge base reset ({workspace})."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 from fastapi.responses import StreamingResponse
 
 @app.post("/api/query")
-async def query_endpoint(req: QueryRequest):
+async def query_endpoint(req: QueryRequest, request: Request):
+    await resolve_workspace(req.workspace)
+    # Shed load up front, before any retrieval work, once the model's queue is full
+    if llm_scheduler.full(req.model or llm_client.model):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Too many requests waiting for {req.model or llm_client.model}. Try again shortly.",
+            headers={"Retry-After": "5"}
+        )
+    # The fairness key is the client address: a client naming itself could take a new
+    # place in the rotation on every request. Only trusted callers may name their users.
+    host = request.client.host if request.client else "anonymous"
+    user = req.user if req.user and host in settings.LLM_TRUSTED_USER_HOSTS else host
+    # Filenames map straight to doc_ids, so both filters end up as one doc_id scope
+    doc_ids = None
+    if req.doc_ids or req.filenames:
+        doc_ids = sorted(set(req.doc_ids or []) | {document_id(f) for f in req.filenames or []})
+
     try:
         return StreamingResponse(
-            rag_engine.query_stream(req.query, history=req.messages),
+            rag_engine.query_stream(
+                req.query,
+                history=req.messages,
+                model=req.model,
+                doc_ids=doc_ids,
+                is_disconnected=request.is_disconnected,
+                include_timings=req.include_timings,
+                workspace=req.workspace,
+                user=user
+            ),
             media_type="application/x-ndjson"
         )
     except Exception as e:
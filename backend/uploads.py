@@ -0,0 +1,167 @@
+import os
+import uuid
+import shutil
+import hashlib
+from typing import NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from .config import settings
+from .workspaces import DEFAULT_WORKSPACE
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+class UploadTooLarge(Exception):
+    pass
+
+class UnsupportedFileType(ValueError):
+    pass
+
+class StoredUpload(NamedTuple):
+    filename: str
+    file_hash: str
+    path: str
+    size: int
+    duplicate: bool  # These exact bytes were already stored
+
+class DocumentStore:
+    """
+    Uploaded files, stored once per content at DOCS_DIR/objects/<hash[:2]>/<hash>.
+    The file type comes from the document's filename, so objects carry no extension.
+
+    Uploads are parsed straight off the request stream: the file part is hashed and
+    written in large blocks as it arrives, then moved into place, so the body is
+    never spooled to a temp file and copied again.
+    """
+    WRITE_BLOCK = 1 << 20
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.incoming = os.path.join(self.objects, "incoming")
+
+    def path(self, file_hash: str) -> str:
+        return os.path.join(self.objects, file_hash[:2], file_hash)
+
+    async def receive(self, request: Request, max_bytes: int, field: str = "file",
+                      extensions: Optional[Tuple[str, ...]] = None) -> StoredUpload:
+        """
+        With extensions set, a file of any other type is rejected (UnsupportedFileType)
+        as soon as its part headers arrive, before any of its body is stored.
+        """
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data upload")
+        declared = request.headers.get("content-length", "")
+        # Multipart framing adds a little on top of the file itself
+        if declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+            raise UploadTooLarge()
+
+        part = {"headers": {}, "field": b"", "value": b"", "target": False}
+        upload = {"filename": None}
+        pending = bytearray()
+
+        def on_part_begin():
+            part.update(headers={}, target=False)
+
+        def on_header_field(data, start, end):
+            part["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            part["value"] += data[start:end]
+
+        def on_header_end():
+            part["headers"][part["field"].lower()] = part["value"]
+            part.update(field=b"", value=b"")
+
+        def on_headers_finished():
+            _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+            if options.get(b"name") == field.encode() and b"filename" in options and upload["filename"] is None:
+                name = options[b"filename"].decode("utf-8", "replace").replace("\\", "/")
+                upload["filename"] = os.path.basename(name)
+                ext = os.path.splitext(upload["filename"])[1].lower()
+                if extensions is not None and ext not in extensions:
+                    raise UnsupportedFileType(f"Unsupported file type: {ext or 'none'}. Supported: {', '.join(extensions)}")
+                part["target"] = True
+
+        def on_part_data(data, start, end):
+            if part["target"]:
+                pending.extend(data[start:end])
+
+        def on_part_end():
+            part["target"] = False
+
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+
+        os.makedirs(self.incoming, exist_ok=True)
+        temp_path = os.path.join(self.incoming, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(f, block: bytes):
+            # sha256 releases the GIL on large buffers, so hashing overlaps the next read
+            f.write(block)
+            digest.update(block)
+
+        try:
+            with open(temp_path, "wb") as f:
+                async for data in request.stream():
+                    parser.write(data)
+                    if size + len(pending) > max_bytes:
+                        raise UploadTooLarge()
+                    if len(pending) >= self.WRITE_BLOCK:
+                        block = bytes(pending)
+                        pending.clear()
+                        size += len(block)
+                        await run_in_threadpool(write, f, block)
+                parser.finalize()
+                if size + len(pending) > max_bytes:
+                    raise UploadTooLarge()
+                size += len(pending)
+                await run_in_threadpool(write, f, bytes(pending))
+
+            if upload["filename"] is None:
+                raise ValueError(f"No file in the '{field}' field")
+            file_hash = digest.hexdigest()
+            path = self.path(file_hash)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+            return StoredUpload(upload["filename"], file_hash, path, size, duplicate)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def remove(self, file_hash: str):
+        path = self.path(file_hash)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def reset(self):
+        shutil.rmtree(self.objects, ignore_errors=True)
+
+document_store = DocumentStore(settings.DOCS_DIR)
+
+def workspace_documents(workspace: str) -> DocumentStore:
+    """
+    Each workspace keeps its own files, so resetting one leaves the others' alone.
+    """
+    if workspace == DEFAULT_WORKSPACE:
+        return document_store
+    return DocumentStore(os.path.join(settings.DOCS_DIR, "workspaces", workspace))
@@ -0,0 +1,514 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+class Records(NamedTuple):
+    ids: List[str]
+    texts: Optional[List[str]]
+    metadatas: List[Dict[str, Any]]
+    embeddings: Optional[List[List[float]]] = None
+
+# (chunk id, text, metadata, cosine distance)
+Hit = Tuple[str, str, Dict[str, Any], float]
+
+class VectorBackend:
+    """
+    Storage interface behind VectorStore. Filters use Chroma's `where` syntax
+    ($and, $or, $eq, $ne, $in, $nin, or a bare value for equality).
+    """
+    def upsert(self, ids: List[str], texts: List[str], embeddings: List[List[float]], metadatas: List[dict]):
+        raise NotImplementedError
+
+    def query(self, embedding: List[float], top_k: int, where: Optional[dict] = None) -> List[Hit]:
+        raise NotImplementedError
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include_text: bool = True, include_embeddings: bool = False) -> Records:
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def memory_estimate(self) -> int:
+        """
+        Rough bytes this index keeps resident when open (vectors plus search structures).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class ChromaBackend(VectorBackend):
+    """
+    hnsw: optional {"M", "construction_ef", "search_ef"}. M and construction_ef only
+    apply when the collection is created; search_ef is also applied to existing ones.
+
+    memory_limit_bytes caps Chroma's own LRU cache of loaded collections, on the Chroma
+    versions that honour it (those that size it by file handles ignore the setting).
+
+    Chroma shares one client, and the indexes it has loaded, between every backend on a
+    path; they are only released once the last of them is closed.
+    """
+    def __init__(self, path: str, collection_name: str = "rag_collection", hnsw: Optional[dict] = None,
+                 memory_limit_bytes: Optional[int] = None):
+        import chromadb
+        from chromadb.config import Settings
+        print(f"Initializing Version Store at {path}")
+        # Chroma shares one client per path, so every backend on it must pass the same settings
+        client_settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=memory_limit_bytes) if memory_limit_bytes else Settings()
+        self.client = chromadb.PersistentClient(path=path, settings=client_settings)
+        self.collection_name = collection_name
+        self.hnsw = {k: v for k, v in (hnsw or {}).items() if v is not None}
+        self._dim: Optional[int] = None
+        self.collection = self._create()
+        self._sync_search_ef()
+
+    def _create(self):
+        metadata = {"hnsw:space": "cosine"}
+        metadata.update({f"hnsw:{k}": v for k, v in self.hnsw.items()})
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=metadata
+        )
+
+    def _sync_search_ef(self):
+        ef = self.hnsw.get("search_ef")
+        current = (self.collection.metadata or {}).get("hnsw:search_ef")
+        config = getattr(self.collection, "configuration", None)
+        if isinstance(config, dict) and config.get("hnsw"):
+            current = config["hnsw"].get("ef_search", current)
+        if ef is None or ef == current:
+            return
+        try:
+            self.collection.modify(configuration={"hnsw": {"ef_search": ef}})
+        except Exception as e:
+            print(f"Could not change search_ef of {self.collection_name}: {e}")
+        for key in ("M", "construction_ef"):
+            if key in self.hnsw and (self.collection.metadata or {}).get(f"hnsw:{key}") not in (None, self.hnsw[key]):
+                print(f"hnsw:{key} only applies to new collections; reset to rebuild {self.collection_name}")
+
+    def upsert(self, ids, texts, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, embedding, top_k, where=None):
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            where=where
+        )
+        if not results['ids']:
+            return []
+        # results is a dict of lists of lists. We grab the first query result.
+        ids = results['ids'][0]
+        dists = results['distances'][0] if results['distances'] else [0.0] * len(ids)
+        return list(zip(ids, results['documents'][0], results['metadatas'][0], dists))
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_text=True, include_embeddings=False):
+        include = ["documents", "metadatas"] if include_text else ["metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        results = self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+        return Records(
+            results['ids'],
+            results['documents'] if include_text else None,
+            results['metadatas'],
+            [list(e) for e in results['embeddings']] if include_embeddings else None
+        )
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def count(self):
+        return self.collection.count()
+
+    def memory_estimate(self):
+        count = self.collection.count()
+        if not count:
+            return 0
+        if self._dim is None:
+            first = self.collection.get(limit=1, include=["embeddings"])
+            self._dim = len(first["embeddings"][0])
+        # float32 vectors plus the graph's bottom layer (2*M neighbour ids per node)
+        return count * (self._dim * 4 + 2 * self.hnsw.get("M", 16) * 4)
+
+    def close(self):
+        # Chroma versions without close() keep the client until exit
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+        self.client = self.collection = None
+
+    def reset(self):
+        try:
+            self.client.delete_collection(name=self.collection_name)
+        except Exception:
+            pass
+        self.collection = self._create()
+
+def _match_value(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and not value == operand:
+            return False
+        if op == "$ne" and not value != operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+    return True
+
+def matches(metadata: dict, where: Optional[dict]) -> bool:
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, w) for w in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, w) for w in condition):
+                return False
+        elif not _match_value(metadata.get(key), condition):
+            return False
+    return True
+
+def _doc_id_prefilter(where: Optional[dict]) -> Optional[List[str]]:
+    """
+    Pulls a doc_id equality / $in constraint out of a filter so it can be answered by index.
+    """
+    if not where:
+        return None
+    if "doc_id" in where:
+        condition = where["doc_id"]
+        if not isinstance(condition, dict):
+            return [condition]
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+    for sub in where.get("$and", []):
+        found = _doc_id_prefilter(sub)
+        if found is not None:
+            return found
+    return None
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process exact search for small and medium corpora.
+
+    Normalized embeddings live in a memory-mapped matrix (vectors.bin) and cosine top-k
+    is one matrix-vector product plus argpartition. Ids, text and metadata live in
+    SQLite; doc_ids are mirrored in memory so document filters never touch the disk.
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, "vectors.bin")
+        self._meta_path = os.path.join(path, "layout.json")
+
+        self._db = sqlite3.connect(os.path.join(path, "records.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, slot INTEGER NOT NULL, doc_id TEXT, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS records_doc ON records (doc_id)")
+        self._db.commit()
+
+        layout = self._read_layout()
+        self.dim = layout.get("dim")
+        self.capacity = layout.get("capacity", 0)
+        self._vectors = None
+        if self.dim and os.path.exists(self._vectors_path):
+            # The file is in the dtype it was built with, whatever the setting says now
+            stored = np.dtype(layout.get("dtype", self.dtype.name))
+            if stored != self.dtype:
+                self._convert(stored)
+            self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+
+        # In-memory mirrors: slot -> id / doc_id code, liveness mask, id -> slot
+        self._doc_codes: Dict[Optional[str], int] = {}
+        self._slot_ids: List[Optional[str]] = [None] * self.capacity
+        self._slot_docs = np.full(self.capacity, -1, dtype=np.int64)
+        self._alive = np.zeros(self.capacity, dtype=bool)
+        self._slots: Dict[str, int] = {}
+        for record_id, slot, doc_id in self._db.execute("SELECT id, slot, doc_id FROM records"):
+            self._slots[record_id] = slot
+            self._slot_ids[slot] = record_id
+            self._slot_docs[slot] = self._doc_code(doc_id)
+            self._alive[slot] = True
+        self._free = [s for s in range(self.capacity - 1, -1, -1) if not self._alive[s]]
+
+    def _convert(self, stored: np.dtype, block: int = 65536):
+        """
+        Rewrites vectors.bin from the dtype it was built with to self.dtype.
+        """
+        print(f"Converting {self._vectors_path} from {stored.name} to {self.dtype.name}...")
+        source = np.memmap(self._vectors_path, dtype=stored, mode="r", shape=(self.capacity, self.dim))
+        temp_path = self._vectors_path + ".converting"
+        target = np.memmap(temp_path, dtype=self.dtype, mode="w+", shape=(self.capacity, self.dim))
+        for i in range(0, self.capacity, block):
+            target[i:i + block] = source[i:i + block]
+        target.flush()
+        del source, target
+        os.replace(temp_path, self._vectors_path)
+        with open(self._meta_path, "w") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "dtype": self.dtype.name}, f)
+
+    def _doc_code(self, doc_id: Optional[str]) -> int:
+        # doc_ids are interned as ints so document filters are a vectorized isin
+        return self._doc_codes.setdefault(doc_id, len(self._doc_codes))
+
+    def _read_layout(self) -> dict:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _grow(self, needed: int):
+        new_capacity = max(self.INITIAL_CAPACITY, self.capacity)
+        while new_capacity < self.capacity + needed:
+            new_capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        # Extending the file keeps existing rows in place; the new tail is sparse
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(new_capacity, self.dim))
+
+        grown = new_capacity - self.capacity
+        self._slot_ids.extend([None] * grown)
+        self._slot_docs = np.concatenate([self._slot_docs, np.full(grown, -1, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(grown, dtype=bool)])
+        self._free = list(range(new_capacity - 1, self.capacity - 1, -1)) + self._free
+        self.capacity = new_capacity
+        with open(self._meta_path, "w") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "dtype": self.dtype.name}, f)
+
+    def upsert(self, ids, texts, embeddings, metadatas):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            new = sum(1 for i in set(ids) if i not in self._slots)
+            if new > len(self._free):
+                self._grow(new - len(self._free))
+
+            rows = []
+            for record_id, text, vector, meta in zip(ids, texts, matrix, metadatas):
+                slot = self._slots.get(record_id)
+                if slot is None:
+                    slot = self._free.pop()
+                    self._slots[record_id] = slot
+                self._vectors[slot] = vector
+                self._slot_ids[slot] = record_id
+                self._slot_docs[slot] = self._doc_code(meta.get("doc_id"))
+                self._alive[slot] = True
+                rows.append((record_id, slot, meta.get("doc_id"), text, json.dumps(meta)))
+
+            # Vectors hit the disk before the records point at them
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records (id, slot, doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def _candidate_slots(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        Slots allowed by the filter, or None for "every live row".
+        """
+        if not where:
+            return None
+        doc_ids = _doc_id_prefilter(where)
+        if doc_ids is not None and set(where) <= {"doc_id"}:
+            # Pure document filter: answered from the in-memory doc_id mirror
+            codes = [self._doc_codes[d] for d in doc_ids if d in self._doc_codes]
+            mask = self._alive & np.isin(self._slot_docs, codes)
+            return np.flatnonzero(mask)
+        records = self._select(where)
+        return np.array([self._slots[i] for i in records.ids], dtype=np.int64)
+
+    def query(self, embedding, top_k, where=None):
+        q = np.asarray(embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        with self._lock:
+            if self._vectors is None or not self._slots:
+                return []
+            slots = self._candidate_slots(where)
+            if slots is None:
+                high = int(np.flatnonzero(self._alive).max()) + 1
+                matrix = self._vectors[:high]
+                scores = self._dot(matrix, q)
+                scores[~self._alive[:high]] = -np.inf
+                slots = np.arange(high)
+            else:
+                if not len(slots):
+                    return []
+                scores = self._dot(self._vectors[slots], q)
+
+            k = min(top_k, int(np.isfinite(scores).sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hit_slots = slots[top]
+            hit_scores = scores[top]
+            ids = [self._slot_ids[s] for s in hit_slots]
+
+        records = self._fetch(ids)
+        return [(i, records[i][0], records[i][1], float(1.0 - s)) for i, s in zip(ids, hit_scores) if i in records]
+
+    def _dot(self, matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return np.asarray(matrix @ q)
+        # float16 has no BLAS path: upcast in blocks to bound the temporary
+        out = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), 65536):
+            out[start:start + 65536] = matrix[start:start + 65536].astype(np.float32) @ q
+        return out
+
+    def _fetch(self, ids: List[str]) -> Dict[str, Tuple[str, dict]]:
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            for record_id, text, meta in self._db.execute(
+                f"SELECT id, text, metadata FROM records WHERE id IN ({marks})", batch
+            ):
+                found[record_id] = (text, json.loads(meta))
+        return found
+
+    def _select(self, where: Optional[dict], ids: Optional[List[str]] = None) -> Records:
+        sql, params = "SELECT id, text, metadata FROM records", []
+        doc_ids = _doc_id_prefilter(where)
+        if ids is not None:
+            sql += f" WHERE id IN ({','.join('?' * len(ids))})"
+            params = list(ids)
+        elif doc_ids is not None:
+            sql += f" WHERE doc_id IN ({','.join('?' * len(doc_ids))})"
+            params = list(doc_ids)
+        sql += " ORDER BY slot"
+
+        out_ids, texts, metas = [], [], []
+        for record_id, text, meta in self._db.execute(sql, params):
+            meta = json.loads(meta)
+            if matches(meta, where):
+                out_ids.append(record_id)
+                texts.append(text)
+                metas.append(meta)
+        return Records(out_ids, texts, metas)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_text=True, include_embeddings=False):
+        with self._lock:
+            if ids is not None and not ids:
+                return Records([], [] if include_text else None, [], [] if include_embeddings else None)
+            records = self._select(where, ids)
+            start = offset or 0
+            end = start + limit if limit is not None else None
+            out_ids = records.ids[start:end]
+            embeddings = None
+            if include_embeddings:
+                slots = [self._slots[i] for i in out_ids]
+                embeddings = np.asarray(self._vectors[slots], dtype=np.float32).tolist() if slots else []
+        return Records(
+            out_ids,
+            records.texts[start:end] if include_text else None,
+            records.metadatas[start:end],
+            embeddings
+        )
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            rows = [(json.dumps(m), m.get("doc_id"), i) for i, m in zip(ids, metadatas) if i in self._slots]
+            self._db.executemany("UPDATE records SET metadata = ?, doc_id = ? WHERE id = ?", rows)
+            self._db.commit()
+            for _, doc_id, record_id in rows:
+                self._slot_docs[self._slots[record_id]] = self._doc_code(doc_id)
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            if ids is None:
+                ids = self._select(where).ids
+            elif where:
+                ids = self._select(where, ids).ids
+            ids = [i for i in ids if i in self._slots]
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                self._db.execute(f"DELETE FROM records WHERE id IN ({','.join('?' * len(batch))})", batch)
+            self._db.commit()
+            for record_id in ids:
+                slot = self._slots.pop(record_id)
+                self._alive[slot] = False
+                self._slot_ids[slot] = None
+                self._slot_docs[slot] = -1
+                self._free.append(slot)
+
+    def count(self):
+        return len(self._slots)
+
+    def memory_estimate(self):
+        # The mapped matrix plus the per-slot mirrors
+        return self.capacity * ((self.dim or 0) * self.dtype.itemsize + 9)
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            self._db.close()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM records")
+            self._db.commit()
+            self._slots.clear()
+            self._slot_ids = [None] * self.capacity
+            self._doc_codes.clear()
+            self._slot_docs = np.full(self.capacity, -1, dtype=np.int64)
+            self._alive = np.zeros(self.capacity, dtype=bool)
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+def create_backend(collection: str = "rag_collection", chroma_path: Optional[str] = None) -> VectorBackend:
+    from .config import settings
+    if settings.VECTOR_BACKEND == "chroma":
+        hnsw = {"M": settings.HNSW_M, "construction_ef": settings.HNSW_CONSTRUCTION_EF, "search_ef": settings.HNSW_SEARCH_EF}
+        memory_limit = settings.WORKSPACE_MEMORY_MB * 1024 * 1024 if settings.WORKSPACE_MEMORY_MB > 0 else None
+        return ChromaBackend(chroma_path or settings.CHROMA_DB_PATH, collection, hnsw=hnsw, memory_limit_bytes=memory_limit)
+    if settings.VECTOR_BACKEND == "numpy":
+        return NumpyBackend(os.path.join(settings.NUMPY_INDEX_PATH, collection), dtype=settings.NUMPY_INDEX_DTYPE)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
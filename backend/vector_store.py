@@ -1,71 +1,329 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from typing import List, Dict, Any
+import threading
+import numpy as np
+from collections import defaultdict
+from typing import Callable, List, Dict, Any, Optional, Set
 from .config import settings
-from .models import Chunk, RetrievalResult, DocumentMetadata
+from .models import Chunk, RetrievalResult, DocumentMetadata, BulkDocument, BulkIngestResponse
+from .ingestion import document_id
+from .lexical_index import BM25Index
+from .registry import DocumentRegistry
+from .vector_backends import VectorBackend, create_backend
 
 class VectorStore:
-    def __init__(self):
-        print(f"Initializing Version Store at {settings.CHROMA_DB_PATH}")
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
-        
-        self.collection = self.client.get_or_create_collection(
-            name="rag_collection",
-            metadata={"hnsw:space": "cosine"}
+    """
+    One knowledge base: chunk vectors, per-document centroids, BM25 index and registry.
+    The defaults are the original (default workspace) store; see workspaces.py for the others.
+    """
+    def __init__(self, collection: str = "rag_collection", documents_collection: str = "rag_documents",
+                 registry_path: Optional[str] = None, bm25_path: Optional[str] = None, chroma_path: Optional[str] = None):
+        self.collection = collection
+        self.documents_collection = documents_collection
+        self.registry_path = registry_path or settings.REGISTRY_PATH
+        self.bm25_path = bm25_path or settings.BM25_INDEX_PATH
+        self.chroma_path = chroma_path
+        # The backend is opened on first use (or at warm-up), not at import
+        self._backend: Optional[VectorBackend] = None
+        self._documents: Optional[VectorBackend] = None
+        self._registry: Optional[DocumentRegistry] = None
+        self._lexical: Optional[BM25Index] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[Set[str]]], None]] = []
+
+    def _open(self):
+        with self._lock:
+            if self._backend is None:
+                backend = create_backend(self.collection, self.chroma_path)
+                self._lexical = BM25Index(self.bm25_path)
+                if self._lexical.count() != backend.count():
+                    self._rebuild_lexical(backend)
+                # One centroid per document, for coarse-to-fine routing
+                self._documents = create_backend(self.documents_collection, self.chroma_path)
+                if not self._documents.count() and backend.count():
+                    self._rebuild_documents(backend)
+                self._registry = DocumentRegistry(self.registry_path)
+                if not self._registry.count() and self._documents.count():
+                    self._rebuild_registry(backend)
+                self._backend = backend
+
+    def _rebuild_lexical(self, backend: VectorBackend, batch_size: int = 1000):
+        # Stores created before the BM25 index existed (or out of sync) get backfilled once
+        print("Rebuilding BM25 index from the vector store...")
+        self._lexical.reset()
+        offset = 0
+        while True:
+            records = backend.get(limit=batch_size, offset=offset)
+            if not records.ids:
+                break
+            self._lexical.add([
+                Chunk(id=i, text=d, metadata=DocumentMetadata(**m))
+                for i, d, m in zip(records.ids, records.texts, records.metadatas)
+            ])
+            offset += len(records.ids)
+
+    def _rebuild_documents(self, backend: VectorBackend, batch_size: int = 1000):
+        print("Computing document centroids from the vector store...")
+        sums, counts, filenames = defaultdict(lambda: 0.0), defaultdict(int), {}
+        offset = 0
+        while True:
+            records = backend.get(limit=batch_size, offset=offset, include_text=False, include_embeddings=True)
+            if not records.ids:
+                break
+            for meta, embedding in zip(records.metadatas, records.embeddings):
+                doc_id = meta.get("doc_id")
+                v = np.asarray(embedding, dtype=np.float32)
+                sums[doc_id] = sums[doc_id] + v / (np.linalg.norm(v) or 1.0)
+                counts[doc_id] += 1
+                filenames[doc_id] = meta.get("filename", "Unknown")
+            offset += len(records.ids)
+        for doc_id in sums:
+            self._write_centroid(doc_id, filenames[doc_id], sums[doc_id] / counts[doc_id], counts[doc_id])
+
+    def _write_centroid(self, doc_id: str, filename: str, centroid: np.ndarray, chunk_count: int):
+        self._documents.upsert(
+            [doc_id], [filename], [centroid.tolist()],
+            [{"doc_id": doc_id, "filename": filename, "chunk_count": chunk_count}]
         )
 
+    def _rebuild_registry(self, backend: VectorBackend):
+        # Stores indexed before the registry existed: recover what the chunks know
+        print("Rebuilding document registry from the vector store...")
+        records = self._documents.get(include_text=False)
+        for doc_id, meta in zip(records.ids, records.metadatas):
+            first = backend.get(where={"doc_id": doc_id}, limit=1, include_text=False)
+            file_hash = first.metadatas[0].get("file_hash", "") if first.ids else ""
+            self._registry.upsert(doc_id, meta.get("filename", "Unknown"), file_hash, meta.get("chunk_count", 0))
+
+    @property
+    def documents(self) -> VectorBackend:
+        if self._backend is None:
+            self._open()
+        return self._documents
+
+    @property
+    def registry(self) -> DocumentRegistry:
+        if self._backend is None:
+            self._open()
+        return self._registry
+
+    @property
+    def lexical(self) -> BM25Index:
+        if self._backend is None:
+            self._open()
+        return self._lexical
+
+    @property
+    def backend(self) -> VectorBackend:
+        if self._backend is None:
+            self._open()
+        return self._backend
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    def warmup(self):
+        self.backend.count()
+
+    def memory_estimate(self) -> int:
+        # Under the store's lock so it can't race close(); a store that isn't loaded holds nothing
+        with self._lock:
+            if self._backend is None:
+                return 0
+            return self._backend.memory_estimate() + self._documents.memory_estimate()
+
+    def close(self):
+        """
+        Releases the indexes and their file handles. The next use opens them again.
+        """
+        with self._lock:
+            if self._backend is None:
+                return
+            for closeable in (self._backend, self._documents, self._registry, self._lexical):
+                closeable.close()
+            self._backend = self._documents = self._registry = self._lexical = None
+
+    def add_listener(self, callback: Callable[[Optional[Set[str]]], None]):
+        """
+        Registers a callback run after every write with the affected doc_ids (None = everything).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, doc_ids: Optional[Set[str]]):
+        for callback in self._listeners:
+            try:
+                callback(doc_ids)
+            except Exception as e:
+                print(f"Vector store listener failed: {e}")
+
     def upsert_chunks(self, chunks: List[Chunk], embeddings: List[List[float]]):
         if not chunks:
             return
             
         ids = [c.id for c in chunks]
         texts = [c.text for c in chunks]
-        # Flatten metadata for Chroma (it prefers flat dicts)
+        # Flatten metadata (Chroma only takes flat dicts)
         metadatas = []
         for c in chunks:
             m = c.metadata.model_dump()
             # Ensure no nested types if any (Pydantic models need to be dicts)
             metadatas.append(m)
 
-        self.collection.upsert(
-            ids=ids,
-            documents=texts,
-            embeddings=embeddings,
-            metadatas=metadatas
+        self.backend.upsert(ids, texts, embeddings, metadatas)
+        self.lexical.add(chunks)
+        self._notify({c.metadata.doc_id for c in chunks})
+
+    def _to_result(self, chunk_id: str, text: str, m: Dict[str, Any], score: float) -> RetrievalResult:
+        return RetrievalResult(
+            chunk_id=chunk_id,
+            doc_id=m.get('doc_id'),
+            filename=m.get('filename', 'Unknown'),
+            page=m.get('page'),
+            chunk_index=m.get('chunk_index', 0),
+            excerpt=text,
+            score=score
         )
 
-    def query(self, query_embedding: List[float], top_k: int = 10) -> List[RetrievalResult]:
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+    def query(self, query_embedding: List[float], top_k: int = 10, where: Optional[dict] = None) -> List[RetrievalResult]:
+        return [
+            self._to_result(chunk_id, text, meta, distance)
+            for chunk_id, text, meta, distance in self.backend.query(query_embedding, top_k, where=where)
+        ]
+
+    def document_count(self) -> int:
+        return self.documents.count()
+
+    def route(self, query_embedding: List[float], top_docs: int) -> List[str]:
+        """
+        Coarse step of two-level search: the doc_ids whose centroids are closest to the query.
+        """
+        return [doc_id for doc_id, _, _, _ in self.documents.query(query_embedding, top_docs)]
+
+    def refresh_document_vector(self, doc_id: str):
+        """
+        Recomputes a document's centroid (mean of its normalized chunk embeddings).
+        Run once a document is fully indexed.
+        """
+        records = self.backend.get(where={"doc_id": doc_id}, include_text=False, include_embeddings=True)
+        if not records.ids:
+            self.documents.delete(ids=[doc_id])
+            return
+        matrix = np.asarray(records.embeddings, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+        filename = records.metadatas[0].get("filename", "Unknown")
+        self._write_centroid(doc_id, filename, matrix.mean(axis=0), len(records.ids))
+
+    def lexical_query(self, query_text: str, top_k: int = 10, doc_ids: Optional[List[str]] = None) -> List[RetrievalResult]:
+        hits = self.lexical.search(query_text, top_k, doc_ids=doc_ids)
+        if not hits:
+            return []
+        records = self.backend.get(ids=[chunk_id for chunk_id, _ in hits])
+        found = {i: (d, m) for i, d, m in zip(records.ids, records.texts, records.metadatas)}
+        return [
+            self._to_result(chunk_id, *found[chunk_id], score)
+            for chunk_id, score in hits if chunk_id in found
+        ]
+
+    def delete_document(self, doc_id: str):
+        self.backend.delete(where={"doc_id": doc_id})
+        self.documents.delete(ids=[doc_id])
+        self.registry.remove(doc_id)
+        self.lexical.remove_document(doc_id)
+        self._notify({doc_id})
+
+    def delete_chunks(self, doc_id: str, ids: List[str]):
+        if ids:
+            self.backend.delete(ids=ids)
+            self.lexical.remove(ids)
+            self._notify({doc_id})
+
+    def document_chunk_ids(self, doc_id: str) -> Set[str]:
+        return set(self.backend.get(where={"doc_id": doc_id}, include_text=False).ids)
+
+    def document_is_current(self, doc_id: str, file_hash: str) -> bool:
+        """
+        True if the document is indexed and every chunk was stamped with this file hash.
+        """
+        existing = self.backend.get(where={"doc_id": doc_id}, limit=1, include_text=False)
+        if not existing.ids:
+            return False
+        stale = self.backend.get(
+            where={"$and": [{"doc_id": doc_id}, {"file_hash": {"$ne": file_hash}}]},
+            limit=1,
+            include_text=False
         )
-        
-        retrieved = []
-        if results['ids']:
-            # results is a dict of lists of lists. We grab the first query result.
-            ids = results['ids'][0]
-            docs = results['documents'][0]
-            metas = results['metadatas'][0]
-            dists = results['distances'][0] if results['distances'] else [0.0]*len(ids)
-
-            for i in range(len(ids)):
-                m = metas[i]
-                retrieved.append(RetrievalResult(
-                    filename=m.get('filename', 'Unknown'),
-                    page=m.get('page'),
-                    chunk_index=m.get('chunk_index', 0),
-                    excerpt=docs[i],
-                    score=dists[i]
-                ))
-        
-        return retrieved
+        return not stale.ids
+
+    def update_chunk_metadata(self, chunks: List[Chunk]):
+        # Positions can shift between revisions without the text (or embedding) changing
+        if chunks:
+            self.backend.update_metadata(
+                [c.id for c in chunks],
+                [c.metadata.model_dump() for c in chunks]
+            )
+            self._notify({c.metadata.doc_id for c in chunks})
+
+    def stamp_document(self, doc_id: str, file_hash: str, batch_size: int = 1000):
+        """
+        Marks a fully indexed document with its file hash. Done last, so an interrupted
+        re-ingestion never looks current.
+        """
+        records = self.backend.get(where={"doc_id": doc_id}, include_text=False)
+        ids, metas = records.ids, records.metadatas
+        for i in range(0, len(ids), batch_size):
+            batch_metas = [dict(m, file_hash=file_hash) for m in metas[i:i + batch_size]]
+            self.backend.update_metadata(ids[i:i + batch_size], batch_metas)
+
+    def finalize_document(self, doc_id: str, filename: str, file_hash: str, removed: List[str], chunk_count: int) -> Optional[str]:
+        """
+        Last step of (re-)indexing a document: drops the chunks the new revision no longer
+        has, stamps the rest and refreshes the centroid and registry row. Returns the file
+        hash of the revision this one replaced, if it was different.
+        """
+        previous = self.registry.get(doc_id)
+        self.delete_chunks(doc_id, removed)
+        self.stamp_document(doc_id, file_hash)
+        self.refresh_document_vector(doc_id)
+        self.registry.upsert(doc_id, filename, file_hash, chunk_count)
+        if previous is not None and previous.file_hash != file_hash:
+            return previous.file_hash
+        return None
+
+    def write_documents(self, documents: List[BulkDocument]) -> BulkIngestResponse:
+        """
+        Indexes whole, already chunked and embedded documents with one upsert for all of
+        them (bulk ingestion). Chunks already stored keep their vectors.
+        """
+        result = BulkIngestResponse(documents=len(documents))
+        known, fresh, vectors, plans = [], [], [], []
+        for doc in documents:
+            doc_id = document_id(doc.filename)
+            if any(c.metadata.doc_id != doc_id for c in doc.chunks):
+                raise ValueError(f"Chunks of {doc.filename} must carry doc_id {doc_id}")
+            existing = self.document_chunk_ids(doc_id)
+            for c in doc.chunks:
+                if c.id in existing:
+                    known.append(c)
+                elif c.id in doc.embeddings:
+                    fresh.append(c)
+                    vectors.append(doc.embeddings[c.id])
+                else:
+                    raise ValueError(f"Missing embedding for new chunk {c.id}")
+            plans.append((doc_id, doc, list(existing - {c.id for c in doc.chunks})))
+
+        self.update_chunk_metadata(known)
+        self.upsert_chunks(fresh, vectors)
+        for doc_id, doc, removed in plans:
+            self.finalize_document(doc_id, doc.filename, doc.file_hash, removed, len(doc.chunks))
+            result.chunks_removed += len(removed)
+        result.chunks_embedded = len(fresh)
+        result.chunks_unchanged = len(known)
+        return result
+
     def reset(self):
-        try:
-            self.client.delete_collection(name="rag_collection")
-        except Exception:
-            pass
-        self.collection = self.client.get_or_create_collection(
-            name="rag_collection",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.backend.reset()
+        self.documents.reset()
+        self.registry.reset()
+        self.lexical.reset()
+        self._notify(None)
+
 vector_store = VectorStore()
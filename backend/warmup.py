@@ -0,0 +1,88 @@
+import time
+import asyncio
+from typing import Dict
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .index_service import index
+from .llm import llm_client
+
+class Readiness:
+    """
+    Tracks background warm-up of the heavy components.
+
+    Readiness only depends on the index service components (embedding model, reranker,
+    vector store), in-process or shared. The Ollama preload is reported but doesn't gate
+    readiness, since Ollama is a separate service that may come up later.
+
+    A component that fails is retried in the background with exponential backoff, so a
+    transient failure (a model download, a busy index service) doesn't leave the
+    service unready for good.
+    """
+    REQUIRED = ("vector_store", "embedding", "reranker")
+
+    def __init__(self):
+        self.components: Dict[str, dict] = {}
+        self._task = None
+        self._retries = set()
+
+    def _set(self, name: str, status: str, **extra):
+        self.components[name] = {"status": status, **extra}
+
+    async def _attempt(self, name: str, fn, attempt: int) -> bool:
+        self._set(name, "loading", attempts=attempt)
+        start = time.perf_counter()
+        try:
+            await fn()
+            self._set(name, "ready", seconds=round(time.perf_counter() - start, 2), attempts=attempt)
+            return True
+        except Exception as e:
+            print(f"Warm-up of {name} failed (attempt {attempt}): {e}")
+            self._set(name, "failed", error=str(e), attempts=attempt)
+            return False
+
+    async def _retry(self, name: str, fn):
+        delay, attempt = settings.WARMUP_RETRY_SECONDS, 1
+        while True:
+            self.components[name]["retry_in"] = delay
+            await asyncio.sleep(delay)
+            attempt += 1
+            if await self._attempt(name, fn, attempt):
+                return
+            delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+
+    async def _warm(self, name: str, fn):
+        # Retries run on their own, so one failing component doesn't hold up the rest
+        if not await self._attempt(name, fn, 1) and settings.WARMUP_RETRY_SECONDS > 0:
+            task = asyncio.get_running_loop().create_task(self._retry(name, fn))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+
+    async def _run(self):
+        await self._warm("vector_store", lambda: run_in_threadpool(index.warmup, "vector_store"))
+        await self._warm("embedding", lambda: run_in_threadpool(index.warmup, "embedding"))
+        if settings.WARMUP_RERANKER:
+            await self._warm("reranker", lambda: run_in_threadpool(index.warmup, "reranker"))
+        if settings.WARMUP_LLM:
+            await self._warm("llm", llm_client.preload)
+
+    def start(self):
+        """
+        Kicks off warm-up without blocking startup, so the container can report live at once.
+        """
+        if not settings.WARMUP_ON_STARTUP:
+            return
+        for name in self.REQUIRED:
+            if name != "reranker" or settings.WARMUP_RERANKER:
+                self._set(name, "pending")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def ready(self) -> bool:
+        # Components that aren't warmed up load lazily on first use and don't gate readiness
+        return all(
+            self.components[name]["status"] == "ready"
+            for name in self.REQUIRED if name in self.components
+        )
+
+readiness = Readiness()
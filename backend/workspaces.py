@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from .config import settings
+from .models import WorkspaceInfo
+from .vector_store import VectorStore, vector_store
+
+DEFAULT_WORKSPACE = "default"
+
+# Also keeps "ws-<name>-documents" within Chroma's collection name rules
+_NAME = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
+
+class UnknownWorkspace(LookupError):
+    pass
+
+def validate_workspace(name: str) -> str:
+    if not _NAME.match(name or ""):
+        raise ValueError("Workspace names are 1-48 letters, digits, '-' or '_', starting and ending with a letter or digit")
+    return name
+
+class WorkspaceManager:
+    """
+    Separate knowledge bases in one index. Each workspace has its own collection,
+    document centroids, BM25 index and registry; the embedding and page text caches
+    are keyed by content and shared. The default workspace is the original store.
+
+    Workspaces are opened on first use. Once more than WORKSPACE_MAX_OPEN are open, or
+    their estimated memory passes WORKSPACE_MEMORY_MB, the least recently used ones are
+    closed. A workspace in use is pinned until released, and the default stays open.
+    Each workspace keeps its Chroma collections in its own directory, so closing it
+    releases its client and loaded indexes.
+    """
+    def __init__(self):
+        self._open: "OrderedDict[str, VectorStore]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[Set[str]]], None]] = []
+        self.evictions = 0
+        self._add(DEFAULT_WORKSPACE, vector_store)
+
+    def _add(self, name: str, store: VectorStore):
+        store.add_listener(self._notify)
+        self._open[name] = store
+
+    def _notify(self, doc_ids: Optional[Set[str]]):
+        for callback in self._listeners:
+            callback(doc_ids)
+
+    def add_listener(self, callback: Callable[[Optional[Set[str]]], None]):
+        """
+        Registers a callback run after a write to any workspace (see VectorStore.add_listener).
+        """
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _path(name: str) -> str:
+        return os.path.join(settings.WORKSPACES_DIR, name)
+
+    def exists(self, name: str) -> bool:
+        return name == DEFAULT_WORKSPACE or name in self._open or os.path.isdir(self._path(name))
+
+    def names(self) -> List[str]:
+        found = os.listdir(settings.WORKSPACES_DIR) if os.path.isdir(settings.WORKSPACES_DIR) else []
+        return [DEFAULT_WORKSPACE] + sorted(n for n in found if n != DEFAULT_WORKSPACE and _NAME.match(n) and os.path.isdir(self._path(n)))
+
+    @contextmanager
+    def use(self, name: str, create: bool = False) -> Iterator[VectorStore]:
+        """
+        The workspace's store, pinned open for the duration of the block. Unknown
+        workspaces raise UnknownWorkspace unless create is set.
+        """
+        validate_workspace(name)
+        with self._lock:
+            store = self._open.get(name)
+            if store is None:
+                if not create and not os.path.isdir(self._path(name)):
+                    raise UnknownWorkspace(name)
+                os.makedirs(self._path(name), exist_ok=True)
+                store = VectorStore(
+                    collection=f"ws-{name}",
+                    documents_collection=f"ws-{name}-documents",
+                    registry_path=os.path.join(self._path(name), "documents.sqlite"),
+                    bm25_path=os.path.join(self._path(name), "bm25.sqlite"),
+                    chroma_path=os.path.join(self._path(name), "chroma"),
+                )
+                self._add(name, store)
+                opened = True
+            else:
+                self._open.move_to_end(name)
+                opened = False
+            self._pins[name] = self._pins.get(name, 0) + 1
+        try:
+            if opened:
+                # Load it first, so the budget counts what it really holds
+                store.warmup()
+                self._evict()
+            yield store
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+
+    def _sizes(self) -> Dict[str, int]:
+        # Estimates can hit the disk: take them outside the lock so use() never waits on them
+        with self._lock:
+            stores = list(self._open.items())
+        return {name: store.memory_estimate() for name, store in stores}
+
+    def _evict(self):
+        budget = settings.WORKSPACE_MEMORY_MB * 1024 * 1024
+        sizes = self._sizes()
+        closing = []
+        with self._lock:
+            total = sum(sizes.get(name, 0) for name in self._open)
+            for name in list(self._open):
+                if len(self._open) <= settings.WORKSPACE_MAX_OPEN and (budget <= 0 or total <= budget):
+                    break
+                if name == DEFAULT_WORKSPACE or self._pins.get(name):
+                    continue
+                closing.append((name, self._open.pop(name)))
+                total -= sizes.get(name, 0)
+                self.evictions += 1
+        # Unpinned and out of the map, so nothing else can reach them
+        for name, store in closing:
+            store.close()
+            print(f"Closed workspace {name} ({sizes.get(name, 0) / 2**20:.0f} MB est.) to stay within the workspace limits.")
+
+    def list(self) -> List[WorkspaceInfo]:
+        open_sizes = self._sizes()
+        return [
+            WorkspaceInfo(name=name, open=name in open_sizes, memory_bytes=open_sizes.get(name, 0))
+            for name in self.names()
+        ]
+
+    def stats(self) -> Dict[str, object]:
+        sizes = self._sizes()
+        return {
+            "open": len(sizes),
+            "memory_bytes": sum(sizes.values()),
+            "evictions": self.evictions,
+        }
+
+workspaces = WorkspaceManager()
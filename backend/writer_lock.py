@@ -0,0 +1,46 @@
+import os
+import json
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-writer is up to the operator
+    fcntl = None
+
+class WriterLock:
+    """
+    Advisory lock on a file in DATA_DIR. Only the process holding it writes the vector
+    store; anyone else (the bulk ingester next to a live server) must go through it.
+    Released automatically when the holder exits, however it exits.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, owner: str) -> bool:
+        if self._fd is not None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps({"owner": owner, "pid": os.getpid()}).encode("utf-8"))
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def holder(self) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.loads(f.read() or "null")
+        except (OSError, ValueError):
+            return None
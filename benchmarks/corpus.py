@@ -0,0 +1,170 @@
+"""
+Reproducible synthetic corpus of PDF, DOCX and TXT files.
+
+    python -m benchmarks.corpus --scale small --out /tmp/corpus
+
+Filler text is drawn from a fixed vocabulary with a seeded RNG. Each page carries one
+planted fact ("The maintenance code for the amber valve assembly is QX-4821.") and
+corpus.json lists a question per fact with the file and page that answers it, so the
+same corpus serves for load tests and for retrieval evaluation.
+"""
+import os
+import json
+import random
+import argparse
+import textwrap
+from typing import Dict, List
+
+from docx import Document as DocxDocument
+
+# name: (documents, pages per document)
+SCALES = {
+    "tiny": (6, 3),
+    "small": (24, 8),
+    "medium": (90, 20),
+    "large": (300, 40),
+}
+
+WORDS = (
+    "system module interface pressure valve sensor control signal output input calibration procedure "
+    "operator manual section figure table value range limit threshold nominal maximum minimum reference "
+    "installation maintenance inspection replacement cycle interval schedule component assembly housing "
+    "cable connector terminal voltage current frequency temperature humidity enclosure mounting bracket "
+    "firmware update configuration parameter default setting network address protocol response request "
+    "error warning status indicator display panel button switch relay circuit board supply filter pump "
+    "flow rate level tank pipe fitting seal gasket bearing shaft motor drive speed torque load safety"
+).split()
+
+ADJECTIVES = (
+    "amber azure crimson golden silver copper violet scarlet ivory onyx cobalt jade coral indigo olive "
+    "slate teal maroon bronze pearl"
+).split()
+
+NOUNS = (
+    "valve pump relay sensor filter turbine gauge actuator compressor regulator manifold coupler "
+    "injector condenser rotor piston spindle nozzle bracket flange"
+).split()
+
+FORMATS = ("pdf", "docx", "txt")
+WORDS_PER_PAGE = 420
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 18))
+    return " ".join(words).capitalize() + "."
+
+def _page_text(rng: random.Random, fact: str) -> List[str]:
+    sentences, count = [], 0
+    while count < WORDS_PER_PAGE:
+        s = _sentence(rng)
+        sentences.append(s)
+        count += len(s.split())
+    sentences.insert(rng.randint(0, len(sentences)), fact)
+    # A few paragraphs per page
+    cuts = sorted(rng.sample(range(1, len(sentences)), 3))
+    bounds = [0] + cuts + [len(sentences)]
+    return [" ".join(sentences[a:b]) for a, b in zip(bounds, bounds[1:])]
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """
+    Minimal PDF writer: one Helvetica text stream per page, enough for pypdf to extract.
+    """
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for paragraphs in pages:
+        lines = []
+        for paragraph in paragraphs:
+            lines.extend(textwrap.wrap(paragraph, 95))
+            lines.append("")
+        body = "BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(f"({escape(l)}) Tj T*" for l in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode(), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def write_docx(path: str, pages: List[List[str]]):
+    doc = DocxDocument()
+    for paragraphs in pages:
+        for paragraph in paragraphs:
+            doc.add_paragraph(paragraph)
+    doc.save(path)
+
+def write_txt(path: str, pages: List[List[str]]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n\n".join(paragraphs) for paragraphs in pages))
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt}
+
+def generate(out_dir: str, scale: str = "small", seed: int = 0) -> Dict:
+    documents, pages_per_doc = SCALES[scale]
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    subjects = [(a, n) for a in ADJECTIVES for n in NOUNS]
+    rng.shuffle(subjects)
+    if documents * pages_per_doc > len(subjects):
+        # Beyond the unique adjective/noun pairs, disambiguate with a model number
+        subjects = [(f"{a} mk{i}", n) for i in range(documents * pages_per_doc // len(subjects) + 1) for a, n in subjects]
+
+    manifest = {"scale": scale, "seed": seed, "files": [], "queries": []}
+    fact_index = 0
+    for d in range(documents):
+        fmt = FORMATS[d % len(FORMATS)]
+        filename = f"doc{d:04d}.{fmt}"
+        # Only PDFs are paginated on ingestion; DOCX/TXT come back as page 1
+        pages = []
+        for p in range(pages_per_doc):
+            adjective, noun = subjects[fact_index]
+            code = f"{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}-{rng.randint(1000, 9999)}"
+            fact = f"The maintenance code for the {adjective} {noun} assembly is {code}."
+            pages.append(_page_text(rng, fact))
+            manifest["queries"].append({
+                "query": f"What is the maintenance code for the {adjective} {noun} assembly?",
+                "answer": code,
+                "filename": filename,
+                "page": p + 1 if fmt == "pdf" else 1,
+            })
+            fact_index += 1
+        WRITERS[fmt](os.path.join(out_dir, filename), pages)
+        manifest["files"].append({"filename": filename, "pages": pages_per_doc if fmt == "pdf" else 1})
+
+    with open(os.path.join(out_dir, "corpus.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="small", choices=list(SCALES))
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    manifest = generate(args.out, args.scale, args.seed)
+    print(f"Wrote {len(manifest['files'])} files with {len(manifest['queries'])} planted facts to {args.out}")
+
+if __name__ == "__main__":
+    main()
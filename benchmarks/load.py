@@ -0,0 +1,243 @@
+"""
+End-to-end load benchmark: starts the stub Ollama and `backend.server:app` under uvicorn
+against a scratch data directory, uploads a synthetic corpus concurrently, then fires
+concurrent queries.
+
+    python -m benchmarks.load --scale small --query-concurrency 8 --queries 100
+
+Reports ingestion pages/s and chunks/s, query latency and time-to-first-token
+percentiles, per-stage medians (from the backend's timings events) and how often the
+planted answer made it into the citations. Results go to JSON with the git commit, so
+runs can be compared across commits.
+
+Runs offline: models must already be in the Hugging Face cache (or be local paths).
+Extra backend settings can be passed with --env KEY=VALUE.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from .corpus import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {f"p{q}": round(float(np.percentile(values, q)), 1) for q in (50, 95, 99)}
+
+def git_revision() -> Dict[str, object]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def server_env(workdir: str, ollama_port: int, args) -> Dict[str, str]:
+    data = os.path.join(workdir, "data")
+    env = dict(
+        os.environ,
+        DATA_DIR=data,
+        DOCS_DIR=os.path.join(workdir, "docs"),
+        CHROMA_DB_PATH=os.path.join(data, "chroma"),
+        EMBEDDING_CACHE_DIR=os.path.join(data, "embedding_cache"),
+        BM25_INDEX_PATH=os.path.join(data, "bm25.sqlite"),
+        REGISTRY_PATH=os.path.join(data, "documents.sqlite"),
+        NUMPY_INDEX_PATH=os.path.join(data, "numpy_index"),
+        PROFILE_DIR=os.path.join(data, "profiles"),
+        PAGE_TEXT_CACHE_PATH=os.path.join(data, "page_text.sqlite"),
+        WRITER_LOCK_PATH=os.path.join(data, ".writer.lock"),
+        OLLAMA_BASE_URL=f"http://127.0.0.1:{ollama_port}",
+        # Repeated benchmark questions would otherwise be served from the answer cache
+        ANSWER_CACHE_ENABLED="true" if args.answer_cache else "false",
+    )
+    if args.offline:
+        env.update(HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+    for pair in args.env:
+        key, _, value = pair.partition("=")
+        env[key] = value
+    return env
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+async def ingest(client: httpx.AsyncClient, corpus_dir: str, files: List[dict], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(filename: str) -> dict:
+        async with semaphore:
+            with open(os.path.join(corpus_dir, filename), "rb") as f:
+                r = await client.post("/api/upload", files={"file": (filename, f.read())})
+            r.raise_for_status()
+            job_id = r.json()["job_id"]
+            while True:
+                job = (await client.get(f"/api/jobs/{job_id}")).json()
+                if job["finished_at"] is not None:
+                    return job
+                await asyncio.sleep(0.2)
+
+    start = time.perf_counter()
+    jobs = await asyncio.gather(*(upload(f["filename"]) for f in files))
+    seconds = time.perf_counter() - start
+
+    pages = sum(j["pages_parsed"] for j in jobs)
+    chunks = sum(j["chunks_total"] for j in jobs)
+    stages = {}
+    for job in jobs:
+        for stage, value in job.get("timings", {}).items():
+            stages.setdefault(stage, []).append(value * 1000)
+    return {
+        "documents": len(jobs),
+        "failed": [j["filename"] for j in jobs if j["status"] not in ("completed", "unchanged")],
+        "seconds": round(seconds, 2),
+        "pages": pages,
+        "chunks": chunks,
+        "pages_per_second": round(pages / seconds, 2),
+        "chunks_per_second": round(chunks / seconds, 2),
+        "stage_ms_p50": {stage: round(float(np.median(v)), 1) for stage, v in stages.items()},
+    }
+
+async def run_queries(client: httpx.AsyncClient, queries: List[dict], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfts, hits, errors = [], [], [], 0
+    stages: Dict[str, List[float]] = {}
+
+    async def ask(item: dict):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            first = None
+            citations = []
+            try:
+                async with client.stream("POST", "/api/query", json={"query": item["query"], "include_timings": True}) as r:
+                    r.raise_for_status()
+                    async for line in r.aiter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if "chunk" in event and first is None:
+                            first = time.perf_counter()
+                        elif "citations" in event:
+                            citations = event["citations"]
+                        elif "timings" in event:
+                            for stage, ms in event["timings"].items():
+                                stages.setdefault(stage, []).append(ms)
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+            if first is not None:
+                ttfts.append((first - start) * 1000)
+            hits.append(any(item["answer"] in c["excerpt"] for c in citations))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(q) for q in queries))
+    seconds = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "queries_per_second": round(len(latencies) / seconds, 2),
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttfts),
+        "stage_ms_p50": {stage: round(float(np.median(v)), 1) for stage, v in stages.items()},
+        "answer_in_citations": round(float(np.mean(hits)), 3) if hits else None,
+    }
+
+async def drive(args, workdir: str, manifest: dict) -> dict:
+    corpus_dir = os.path.join(workdir, "corpus")
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=httpx.Timeout(600.0)) as client:
+        await wait_ready(client, "/api/ready", args.startup_timeout)
+        ingestion = await ingest(client, corpus_dir, manifest["files"], args.upload_concurrency)
+        print(f"Ingested {ingestion['pages']} pages / {ingestion['chunks']} chunks in {ingestion['seconds']}s")
+
+        pool = manifest["queries"]
+        queries = [pool[i % len(pool)] for i in range(args.queries)]
+        result = await run_queries(client, queries, args.query_concurrency)
+        print(f"{result['queries']} queries: latency {result['latency_ms']}, TTFT {result['ttft_ms']}")
+        return {"ingestion": ingestion, "queries": result}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--query-concurrency", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--prompt-seconds", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache on")
+    parser.add_argument("--online", dest="offline", action="store_false", help="Allow model downloads")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend setting")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    manifest = generate(os.path.join(workdir, "corpus"), args.scale, args.seed)
+    os.makedirs(os.path.join(workdir, "docs"), exist_ok=True)
+
+    logs = open(os.path.join(workdir, "server.log"), "w")
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_ollama", "--port", str(args.ollama_port),
+         "--tokens-per-second", str(args.tokens_per_second), "--tokens", str(args.tokens),
+         "--prompt-seconds", str(args.prompt_seconds)],
+        cwd=REPO_DIR, stdout=logs, stderr=subprocess.STDOUT
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.server:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=REPO_DIR, env=server_env(workdir, args.ollama_port, args), stdout=logs, stderr=subprocess.STDOUT
+    )
+    try:
+        results = asyncio.run(drive(args, workdir, manifest))
+    finally:
+        for process in (server, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        logs.close()
+
+    report = {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        **results,
+    }
+    output = args.output
+    if output is None:
+        results_dir = os.path.join(REPO_DIR, "benchmarks", "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'][:8]}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.keep:
+        print(f"Scratch directory kept at {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
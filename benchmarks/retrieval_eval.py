@@ -0,0 +1,296 @@
+"""
+Retrieval quality vs. latency sweep over candidate depth, rerank depth and the Chroma
+HNSW parameters. Prints a recall@k / latency table with the Pareto-optimal rows marked.
+
+Query sets (pick one):
+    --scale small           synthetic corpus (benchmarks.corpus) ingested into a scratch store;
+                            the relevant chunks are the ones holding each planted answer
+    --labels pairs.json     [{"query": ..., "relevant": [chunk_id, ...]}] or
+                            [{"query": ..., "answer": "text the relevant chunk contains"}],
+                            evaluated against a copy of the configured store
+    --sample 200            queries cut from random chunks of (a copy of) the configured store
+
+    python -m benchmarks.retrieval_eval --scale small --candidates 15 30 45 90 --rerank-depth 15 30 45 \\
+        --hnsw-m 16 32 --construction-ef 100 200 --search-ef 10 50 100
+
+Every data path is redirected to a scratch directory, and the configured store is
+copied there before it is evaluated (opening it can rebuild its BM25 index or document
+centroids), so live data is never modified. Every HNSW build is a scratch copy of the
+stored embeddings. Rerank scores don't depend on the sweep, so each (query, chunk) pair is
+scored once and rerank latency is measured per depth.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import itertools
+from typing import Dict, List
+
+import numpy as np
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+# The stores --labels / --sample evaluate; caches are left behind and start empty
+STORE_PATHS = ("CHROMA_DB_PATH", "NUMPY_INDEX_PATH", "BM25_INDEX_PATH", "REGISTRY_PATH")
+
+def redirect_data(settings, data: str, copy_live: bool):
+    """
+    Points every data path at the scratch directory, copying the configured store
+    there first if copy_live is set. Run before anything opens the store.
+    """
+    from backend.config import DERIVED_PATHS
+    for name, parent, leaf in DERIVED_PATHS:
+        if parent != "DATA_DIR":
+            continue
+        live, scratch = getattr(settings, name), os.path.join(data, leaf)
+        if copy_live and name in STORE_PATHS:
+            if os.path.isdir(live):
+                shutil.copytree(live, scratch)
+            else:
+                # SQLite files with their WAL, if any
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(live + suffix):
+                        os.makedirs(data, exist_ok=True)
+                        shutil.copy2(live + suffix, scratch + suffix)
+        setattr(settings, name, scratch)
+    settings.DATA_DIR = data
+
+def load_store(vector_store, batch_size: int = 1000):
+    ids, texts, metas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        records = vector_store.backend.get(limit=batch_size, offset=offset, include_embeddings=True)
+        if not records.ids:
+            break
+        ids += records.ids
+        texts += records.texts
+        metas += records.metadatas
+        embeddings += records.embeddings
+        offset += len(records.ids)
+    return ids, texts, metas, np.asarray(embeddings, dtype=np.float32)
+
+def ingest_synthetic(scale: str, seed: int, workdir: str) -> List[dict]:
+    from benchmarks.corpus import generate
+    from backend.ingestion import ingestion_service, batched
+    from backend.embeddings import embedding_model
+    from backend.vector_store import vector_store
+
+    corpus_dir = os.path.join(workdir, "corpus")
+    manifest = generate(corpus_dir, scale, seed)
+    for f in manifest["files"]:
+        chunks = ingestion_service.process_document(os.path.join(corpus_dir, f["filename"]), f["filename"])
+        for batch in batched(chunks, 64):
+            vector_store.upsert_chunks(batch, embedding_model.generate([c.text for c in batch]))
+    return manifest["queries"]
+
+def labelled_items(items: List[dict], ids: List[str], texts: List[str]) -> List[dict]:
+    out = []
+    for item in items:
+        if "relevant" in item:
+            relevant = set(item["relevant"])
+        else:
+            relevant = {i for i, t in zip(ids, texts) if item["answer"] in t}
+        if relevant:
+            out.append({"query": item["query"], "relevant": relevant})
+    return out
+
+def sampled_items(count: int, ids: List[str], texts: List[str], seed: int) -> List[dict]:
+    # A 10-word span of a chunk, asked as a query, should find that chunk
+    rng = random.Random(seed)
+    out = []
+    for index in rng.sample(range(len(ids)), min(count, len(ids))):
+        words = texts[index].split()
+        if len(words) < 12:
+            continue
+        start = rng.randint(0, len(words) - 10)
+        out.append({"query": " ".join(words[start:start + 10]), "relevant": {ids[index]}})
+    return out
+
+class Evaluator:
+    def __init__(self, items: List[dict], query_embeddings: np.ndarray, target_k: int, hybrid: bool):
+        from backend.models import RetrievalResult
+        self.RetrievalResult = RetrievalResult
+        self.items = items
+        self.query_embeddings = query_embeddings
+        self.target_k = target_k
+        self.hybrid = hybrid
+        self._scores: Dict[tuple, float] = {}
+        self._lexical: List[List] = []
+        self.lexical_ms = 0.0
+
+    def prepare_lexical(self, vector_store, depth: int):
+        latencies = []
+        for item in self.items:
+            start = time.perf_counter()
+            self._lexical.append(vector_store.lexical_query(item["query"], top_k=depth) if self.hybrid else [])
+            latencies.append((time.perf_counter() - start) * 1000)
+        self.lexical_ms = percentile(latencies, 50) if self.hybrid else 0.0
+
+    def rerank_latency(self, depths: List[int], texts: List[str], samples: int = 5) -> Dict[int, float]:
+        from backend.reranker import reranker
+        reranker.warmup()
+        out = {}
+        for depth in depths:
+            runs = []
+            for item in self.items[:samples]:
+                pairs = [[item["query"], texts[i % len(texts)]] for i in range(depth)]
+                start = time.perf_counter()
+                reranker.predict(pairs)
+                runs.append((time.perf_counter() - start) * 1000)
+            out[depth] = percentile(runs, 50)
+        return out
+
+    def rerank_scores(self, query_index: int, docs: List) -> List[float]:
+        from backend.reranker import reranker
+        query = self.items[query_index]["query"]
+        missing = [d for d in docs if (query_index, d.chunk_id) not in self._scores]
+        if missing:
+            for doc, score in zip(missing, reranker.predict([[query, d.excerpt] for d in missing])):
+                self._scores[(query_index, doc.chunk_id)] = float(score)
+        return [self._scores[(query_index, d.chunk_id)] for d in docs]
+
+    def dense(self, backend, top_k: int):
+        results, latencies = [], []
+        for q in self.query_embeddings:
+            start = time.perf_counter()
+            hits = backend.query(q.tolist(), top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append([
+                self.RetrievalResult(chunk_id=i, doc_id=m.get("doc_id"), filename=m.get("filename", ""), page=m.get("page"),
+                                     chunk_index=m.get("chunk_index", 0), excerpt=t, score=d)
+                for i, t, m, d in hits
+            ])
+        return results, percentile(latencies, 50)
+
+    def score(self, dense_results: List[List], candidates: int, depth: int) -> Dict[str, float]:
+        from backend.rag_engine import _reciprocal_rank_fusion
+        candidate_recall, recall, mrr = [], [], []
+        for qi, (item, dense) in enumerate(zip(self.items, dense_results)):
+            dense = [d.model_copy() for d in dense[:candidates]]
+            if self.hybrid:
+                lexical = [d.model_copy() for d in self._lexical[qi][:candidates]]
+                fused = _reciprocal_rank_fusion([dense, lexical], candidates)
+            else:
+                fused = dense
+            relevant = item["relevant"]
+            wanted = min(len(relevant), self.target_k)
+            candidate_recall.append(len({d.chunk_id for d in fused} & relevant) / min(len(relevant), candidates))
+
+            pool = fused[:max(depth, self.target_k)]
+            scores = self.rerank_scores(qi, pool)
+            ranked = [d for _, d in sorted(zip(scores, pool), key=lambda sd: sd[0], reverse=True)][:self.target_k]
+            top = [d.chunk_id for d in ranked]
+            recall.append(len(set(top) & relevant) / wanted)
+            rank = next((r for r, chunk_id in enumerate(top) if chunk_id in relevant), None)
+            mrr.append(1.0 / (rank + 1) if rank is not None else 0.0)
+        return {
+            "candidate_recall": float(np.mean(candidate_recall)),
+            "recall": float(np.mean(recall)),
+            "mrr": float(np.mean(mrr)),
+        }
+
+def pareto(rows: List[dict]) -> List[dict]:
+    for row in rows:
+        row["pareto"] = not any(
+            other["recall"] >= row["recall"] and other["total_ms"] <= row["total_ms"]
+            and (other["recall"] > row["recall"] or other["total_ms"] < row["total_ms"])
+            for other in rows
+        )
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--scale", default="small", help="Synthetic corpus scale (default)")
+    source.add_argument("--labels", help="Labelled query file, evaluated against the configured store")
+    source.add_argument("--sample", type=int, help="Sample this many queries from the configured store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top-k", type=int, default=None, help="Chunks kept after reranking (default TOP_K_RETRIEVAL)")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[15, 30, 45, 90])
+    parser.add_argument("--rerank-depth", type=int, nargs="+", default=[15, 30, 45])
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--no-hybrid", action="store_true", help="Dense only, even if HYBRID_SEARCH is on")
+    parser.add_argument("--output", help="Write all rows as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-retrieval-")
+    synthetic = args.labels is None and args.sample is None
+
+    from backend.config import settings
+    try:
+        # The store singleton takes its paths at import: redirect them before importing it
+        redirect_data(settings, os.path.join(workdir, "data"), copy_live=not synthetic)
+        from backend.embeddings import embedding_model
+        from backend.vector_store import vector_store
+        from backend.vector_backends import ChromaBackend
+
+        if synthetic:
+            raw_items = ingest_synthetic(args.scale, args.seed, workdir)
+        elif args.labels:
+            with open(args.labels) as f:
+                raw_items = json.load(f)
+        ids, texts, metas, embeddings = load_store(vector_store)
+        if not ids:
+            sys.exit("The store is empty: nothing to evaluate.")
+        items = sampled_items(args.sample, ids, texts, args.seed) if args.sample else labelled_items(raw_items, ids, texts)
+        print(f"{len(ids)} chunks, {len(items)} labelled queries")
+
+        target_k = args.top_k or settings.TOP_K_RETRIEVAL
+        query_embeddings = np.asarray(embedding_model.generate([i["query"] for i in items]), dtype=np.float32)
+        evaluator = Evaluator(items, query_embeddings, target_k, settings.HYBRID_SEARCH and not args.no_hybrid)
+        max_candidates = max(args.candidates)
+        evaluator.prepare_lexical(vector_store, max_candidates)
+        rerank_ms = evaluator.rerank_latency(sorted({max(d, target_k) for d in args.rerank_depth}), texts)
+
+        rows = []
+        for m, construction_ef in itertools.product(args.hnsw_m, args.construction_ef):
+            name = f"eval-m{m}-c{construction_ef}"
+            path = os.path.join(workdir, "sweep")
+            start = time.perf_counter()
+            index = ChromaBackend(path, name, hnsw={"M": m, "construction_ef": construction_ef})
+            for i in range(0, len(ids), 1000):
+                index.upsert(ids[i:i + 1000], texts[i:i + 1000], embeddings[i:i + 1000].tolist(), metas[i:i + 1000])
+            build_s = time.perf_counter() - start
+
+            for search_ef in args.search_ef:
+                index = ChromaBackend(path, name, hnsw={"M": m, "construction_ef": construction_ef, "search_ef": search_ef})
+                dense_results, dense_ms = evaluator.dense(index, max_candidates)
+                for candidates, depth in itertools.product(args.candidates, args.rerank_depth):
+                    if depth > candidates:
+                        continue
+                    quality = evaluator.score(dense_results, candidates, depth)
+                    total = dense_ms + evaluator.lexical_ms + rerank_ms[max(depth, target_k)]
+                    rows.append({
+                        "M": m, "construction_ef": construction_ef, "search_ef": search_ef,
+                        "candidates": candidates, "rerank_depth": depth, "build_s": round(build_s, 1),
+                        **{k: round(v, 4) for k, v in quality.items()},
+                        "search_ms": round(dense_ms + evaluator.lexical_ms, 2),
+                        "rerank_ms": round(rerank_ms[max(depth, target_k)], 2),
+                        "total_ms": round(total, 2),
+                    })
+            index.client.delete_collection(name)
+
+        rows = sorted(pareto(rows), key=lambda r: r["total_ms"])
+        print(f"\nrecall@{target_k} vs latency (* = Pareto-optimal)")
+        print(f"{'':2}{'M':>4}{'c_ef':>6}{'s_ef':>6}{'cand':>6}{'depth':>7}{'cand_rec':>10}{'recall':>9}{'mrr':>8}{'search':>9}{'rerank':>9}{'total':>9}")
+        for r in rows:
+            print(f"{'*' if r['pareto'] else '':2}{r['M']:>4}{r['construction_ef']:>6}{r['search_ef']:>6}{r['candidates']:>6}"
+                  f"{r['rerank_depth']:>7}{r['candidate_recall']:>10.3f}{r['recall']:>9.3f}{r['mrr']:>8.3f}"
+                  f"{r['search_ms']:>9.2f}{r['rerank_ms']:>9.2f}{r['total_ms']:>9.2f}")
+        print("\nApply a row with HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF, RETRIEVAL_CANDIDATES and RERANK_DEPTH.")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"top_k": target_k, "queries": len(items), "chunks": len(ids), "rows": rows}, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
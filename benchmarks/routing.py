@@ -0,0 +1,106 @@
+"""
+Flat vs coarse-to-fine (document-routed) chunk search: latency and recall@k against
+exact flat search, for a few routing widths.
+
+    python -m benchmarks.routing --docs 500 2000 --backend chroma
+
+Runs the real VectorStore against a throwaway data directory.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+def synthetic_corpus(docs: int, chunks_per_doc: int, dim: int, seed: int = 0):
+    # Topics -> documents -> chunks, so documents have real (overlapping) centroids
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(docs // 10, 4), dim)).astype(np.float32)
+    doc_centers = topics[rng.integers(0, len(topics), size=docs)] + 0.7 * rng.normal(size=(docs, dim)).astype(np.float32)
+    doc_of_chunk = np.repeat(np.arange(docs), chunks_per_doc)
+    vectors = doc_centers[doc_of_chunk] + 0.9 * rng.normal(size=(len(doc_of_chunk), dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, doc_of_chunk
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2)
+
+def run(docs: int, args, workdir: str):
+    from backend.models import Chunk, DocumentMetadata
+    from backend.vector_store import VectorStore
+
+    # Its own store with explicit scratch paths, never the process-wide (live) one
+    vector_store = VectorStore(
+        registry_path=os.path.join(workdir, "documents.sqlite"),
+        bm25_path=os.path.join(workdir, "bm25.sqlite"),
+    )
+    vectors, doc_of_chunk = synthetic_corpus(docs, args.chunks_per_doc, args.dim)
+    vector_store.reset()
+    start = time.perf_counter()
+    for i in range(0, len(vectors), 2000):
+        chunks = [
+            Chunk(id=f"c{j}", text=f"chunk {j}", metadata=DocumentMetadata(
+                filename=f"d{doc_of_chunk[j]}.txt", page=1, chunk_index=j, doc_id=f"d{doc_of_chunk[j]}"))
+            for j in range(i, min(i + 2000, len(vectors)))
+        ]
+        vector_store.upsert_chunks(chunks, vectors[i:i + len(chunks)].tolist())
+    for d in range(docs):
+        vector_store.refresh_document_vector(f"d{d}")
+    print(f"\n{docs} documents, {len(vectors)} chunks (indexed in {time.perf_counter() - start:.1f}s)")
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.top_k]
+
+    print(f"{'mode':<14}{'p50 ms':>9}{'p95 ms':>9}{'recall':>9}")
+    for width in [None] + args.widths:
+        latencies, recalls = [], []
+        for q, expected in zip(queries.tolist(), truth):
+            start = time.perf_counter()
+            where = None
+            if width is not None:
+                where = {"doc_id": {"$in": vector_store.route(q, width)}}
+            hits = vector_store.query(q, top_k=args.top_k, where=where)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len({h.chunk_id for h in hits} & {f"c{j}" for j in expected}) / args.top_k)
+        mode = "flat" if width is None else f"route top {width}"
+        print(f"{mode:<14}{percentile(latencies, 50):>9}{percentile(latencies, 95):>9}{np.mean(recalls):>9.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--chunks-per-doc", type=int, default=25)
+    parser.add_argument("--widths", type=int, nargs="+", default=[5, 10, 20, 50])
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=45)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-routing-")
+    # Settings are read at import, so point the store at the scratch directory first
+    os.environ.update(
+        VECTOR_BACKEND=args.backend,
+        DATA_DIR=workdir,
+        CHROMA_DB_PATH=os.path.join(workdir, "chroma"),
+        NUMPY_INDEX_PATH=os.path.join(workdir, "numpy_index"),
+        BM25_INDEX_PATH=os.path.join(workdir, "bm25.sqlite"),
+        REGISTRY_PATH=os.path.join(workdir, "documents.sqlite"),
+        EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+        PAGE_TEXT_CACHE_PATH=os.path.join(workdir, "page_text.sqlite"),
+        WRITER_LOCK_PATH=os.path.join(workdir, ".writer.lock"),
+        WORKSPACES_DIR=os.path.join(workdir, "workspaces"),
+    )
+    try:
+        for docs in args.docs:
+            run(docs, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
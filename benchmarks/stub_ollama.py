@@ -0,0 +1,63 @@
+"""
+Stand-in for the Ollama endpoints the backend uses (/api/chat, /api/generate), with a
+configurable token rate, so query benchmarks measure this service rather than the LLM.
+
+    python -m benchmarks.stub_ollama --port 11500 --tokens-per-second 40 --tokens 120
+"""
+import json
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+def create_app(tokens_per_second: float, tokens: int, prompt_seconds: float) -> FastAPI:
+    app = FastAPI(title="Stub Ollama")
+    app.state.requests = 0
+    app.state.aborted = 0
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+
+        async def stream():
+            try:
+                # Prompt processing, then a steady token stream
+                await asyncio.sleep(prompt_seconds)
+                for i in range(tokens):
+                    yield json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": f"token{i} "}, "done": False}) + "\n"
+                    await asyncio.sleep(1 / tokens_per_second)
+                yield json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": ""}, "done": True, "eval_count": tokens}) + "\n"
+            except asyncio.CancelledError:
+                app.state.aborted += 1
+                raise
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        # Only used to preload models
+        body = await request.json()
+        return {"model": body.get("model"), "response": "", "done": True}
+
+    @app.get("/api/stats")
+    def stats():
+        return {"requests": app.state.requests, "aborted": app.state.aborted}
+
+    return app
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens per answer")
+    parser.add_argument("--prompt-seconds", type=float, default=0.2, help="Delay before the first token")
+    args = parser.parse_args()
+    app = create_app(args.tokens_per_second, args.tokens, args.prompt_seconds)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Side-by-side benchmark of the vector backends: query latency, recall@k against exact
+search, and resident memory, across corpus sizes.
+
+    python -m benchmarks.vector_backends --sizes 10000 50000 200000
+
+Every (backend, size) pair is built and queried in its own subprocess so RSS numbers
+aren't polluted by the other runs (or by the ground-truth computation).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+BACKENDS = ("chroma", "numpy-float16", "numpy-float32")
+
+def synthetic_corpus(size: int, dim: int, seed: int = 0):
+    # Clustered vectors look more like real embeddings than uniform noise does
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(size // 500, 8), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=size)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, labels
+
+def open_backend(name: str, path: str):
+    from backend.vector_backends import ChromaBackend, NumpyBackend
+    if name == "chroma":
+        return ChromaBackend(path)
+    return NumpyBackend(path, dtype=name.split("-", 1)[1])
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+def build(name: str, path: str, size: int, dim: int, queries: int, top_k: int, batch_size: int = 2000):
+    vectors, labels = synthetic_corpus(size, dim)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, size, size=queries)
+    query_vectors = vectors[picks] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :top_k]
+
+    store = open_backend(name, path)
+    start = time.perf_counter()
+    for i in range(0, size, batch_size):
+        ids = [f"c{j}" for j in range(i, min(i + batch_size, size))]
+        store.upsert(
+            ids,
+            [f"chunk {j}" for j in range(i, i + len(ids))],
+            vectors[i:i + len(ids)].tolist(),
+            [{"doc_id": f"d{labels[j]}", "filename": f"d{labels[j]}.txt", "page": 1, "chunk_index": j}
+             for j in range(i, i + len(ids))]
+        )
+    build_seconds = time.perf_counter() - start
+
+    with open(os.path.join(path, "queries.json"), "w") as f:
+        json.dump({"queries": query_vectors.tolist(), "truth": [[f"c{j}" for j in row] for row in truth]}, f)
+    return {"build_seconds": round(build_seconds, 2)}
+
+def query(name: str, path: str, top_k: int):
+    with open(os.path.join(path, "queries.json")) as f:
+        data = json.load(f)
+    store = open_backend(name, path)
+    store.query(data["queries"][0], top_k)  # first query pays for loading the index
+
+    latencies, recalls = [], []
+    for q, truth in zip(data["queries"], data["truth"]):
+        start = time.perf_counter()
+        hits = store.query(q, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({h[0] for h in hits} & set(truth)) / len(truth))
+
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "recall": round(float(np.mean(recalls)), 4),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+def run_worker(args):
+    if args.worker == "build":
+        result = build(args.backend, args.path, args.size, args.dim, args.queries, args.top_k)
+    else:
+        result = query(args.backend, args.path, args.top_k)
+    print(json.dumps(result))
+
+def spawn(phase: str, backend: str, path: str, args) -> dict:
+    cmd = [
+        sys.executable, "-m", "benchmarks.vector_backends", "--worker", phase, "--backend", backend,
+        "--path", path, "--size", str(args.size), "--dim", str(args.dim),
+        "--queries", str(args.queries), "--top-k", str(args.top_k)
+    ]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=45)
+    parser.add_argument("--output", help="Write the results as JSON here as well")
+    # Internal: a single build/query run inside a subprocess
+    parser.add_argument("--worker", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    rows = []
+    print(f"{'backend':<15}{'size':>9}{'build s':>10}{'p50 ms':>9}{'p95 ms':>9}{'recall':>9}{'RSS MB':>9}")
+    for size in args.sizes:
+        args.size = size
+        for backend in args.backends:
+            workdir = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+            try:
+                row = {"backend": backend, "size": size}
+                row.update(spawn("build", backend, workdir, args))
+                row.update(spawn("query", backend, workdir, args))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            rows.append(row)
+            print(f"{backend:<15}{size:>9}{row['build_seconds']:>10}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                  f"{row['recall']:>9}{row['rss_mb']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()